@@ -3,13 +3,18 @@ import adsk.fusion
 import traceback
 import json
 import os
+import time
 from . import commands
 from . import config
 from . import database_thread
+from .icon_store import get_icon_filename
+from .metrics import g_metrics
+from .tracer import g_tracer, traced
 
 from .commands.insertPart import entry as insertPart
 from .commands.insertSpacer import entry as insertSpacer
 from .commands.makeSpacer import entry as setJoint
+from .commands.profileSession import entry as profileSession
 
 from .lib import fusionAddInUtils as futil
 
@@ -81,9 +86,13 @@ def load_favorites():
 def save_favorites():
     """Persist favorites mapping to disk."""
     try:
+        # Write a temporary file and rename it over the old one so
+        # a crash while saving can't leave a half written file
         path = _favorites_path()
-        with open(path, 'w') as f:
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
             json.dump(g_favorites, f, indent=2)
+        os.replace(temp_path, path)
     except Exception:
         pass
     
@@ -92,27 +101,79 @@ def _palette_html_path():
     """Path to the HTML palette file."""
     return os.path.join(os.path.dirname(__file__), 'frc_cots_palette.html')
 
+def _palette_part(path, label, dfid):
+    """One part record as the HTML palette expects it."""
+    return {
+        'id': dfid,
+        'path': path,
+        'label': label,
+        'favorite': g_favorites.get(dfid, False),
+        'thumb': get_icon_filename(dfid)
+    }
+
+@traced()
 def send_parts_to_palette(palette: adsk.core.Palette):
-    """Send the parts list to the HTML palette used to browse COTS parts."""
+    """Send the full parts list to the HTML palette used to browse COTS parts."""
 
     futil.log(f'send_parts_to_palette()....')
 
     try:
-        parts = []
-        cots_files = database_thread.get_sorted_database_list()
-        for idx, (path, label, dfid, icon_name) in enumerate(cots_files):
-            parts.append({
-                'index': idx,
-                'path': path,
-                'label': label,
-                'favorite': g_favorites.get(dfid, False),
-                'thumb': icon_name
-            })
-        futil.log(f'   Sending {len(parts)} records to palette...')
-        palette.sendInfoToHTML('partsList', json.dumps(parts))
+        with g_metrics.timer('palette.send_parts'):
+            cots_files, epoch, seq = database_thread.get_database_snapshot()
+            folders = database_thread.get_database_folders()
+            parts = [_palette_part(path, label, dfid) for (path, label, dfid) in cots_files]
+            futil.log(f'   Sending {len(parts)} records to palette...')
+            palette.sendInfoToHTML('partsList', json.dumps({'epoch': epoch, 'seq': seq,
+                                                            'folders': folders, 'parts': parts}))
+        g_metrics.set('palette.parts_sent', len(parts))
+        record_first_list(len(parts))
     except:
         futil.handle_error('load_palette failed:')
 
+def record_first_list(part_count):
+    """Log the time from starting the database thread until the palette first had parts to show."""
+    if not g_dbThread or g_dbThread.first_list_time is not None or part_count == 0:
+        return
+
+    g_dbThread.first_list_time = time.time() - g_dbThread.start_time
+    g_metrics.set('startup.first_list_seconds', g_dbThread.first_list_time)
+    g_tracer.instant('palette.first_list', parts=part_count)
+    futil.log(f'Time to first list: {g_dbThread.first_list_time:.3f} s ({part_count} parts)')
+
+def send_changes_to_palette(palette: adsk.core.Palette, epoch, since):
+    """Send the parts that changed after sequence number 'since' to the HTML palette.
+    Falls back to the full list if the palette is out of step with the change feed."""
+
+    try:
+        delta = database_thread.get_database_changes(epoch, since)
+        if delta is None:
+            futil.log(f'send_changes_to_palette() -- Cannot send changes since {since}, sending all parts...')
+            send_parts_to_palette(palette)
+            return
+
+        with g_metrics.timer('palette.send_changes'):
+            delta['parts'] = [_palette_part(path, label, dfid) for (path, label, dfid) in delta['parts']]
+            futil.log(f'send_changes_to_palette() -- Sending {len(delta["parts"])} changed '
+                      f'and {len(delta["removed"])} removed records to palette...')
+            palette.sendInfoToHTML('partsDelta', json.dumps(delta))
+    except:
+        futil.handle_error('send_changes_to_palette failed:')
+
+def notify_palette_of_changes(palette: adsk.core.Palette):
+    """Tell the HTML palette the latest change feed sequence number.
+    The palette asks for the changes if it is behind."""
+    epoch, seq = database_thread.get_database_sequence()
+    palette.sendInfoToHTML('partsChanged', json.dumps({'epoch': epoch, 'seq': seq}))
+
+def send_stats_to_palette(palette: adsk.core.Palette):
+    """Send a snapshot of the metrics to the stats view of the HTML palette."""
+    try:
+        stats = g_metrics.snapshot()
+        stats['profiling'] = profileSession.is_profiling()
+        palette.sendInfoToHTML('stats', json.dumps(stats))
+    except:
+        futil.handle_error('send_stats_to_palette failed:')
+
 def get_palette() -> adsk.core.Palette:
     """Return the HTML palette used to browse COTS parts."""
     global g_palette
@@ -206,7 +267,7 @@ class DatabaseThreadEventHandler(adsk.core.CustomEventHandler):
             palette = get_palette()
             if not palette:
                 return
-            send_parts_to_palette(palette)
+            notify_palette_of_changes(palette)
 
         elif action == "status":
             palette = get_palette()
@@ -236,6 +297,18 @@ class FRCHTMLHandler(adsk.core.HTMLEventHandler):
             if action == 'requestParts':
                 send_parts_to_palette(palette)
 
+            # HTML asks for the parts that changed since the last
+            # sequence number it has seen
+            elif action == 'requestChanges':
+                try:
+                    payload = json.loads(data) if data else {}
+                    epoch = str(payload.get('epoch', ''))
+                    since = int(payload.get('since', -1))
+                except Exception:
+                    epoch = ''
+                    since = -1
+                send_changes_to_palette(palette, epoch, since)
+
             # HTML palette is active and ready to receive data
             # send it the parts list
             elif action == 'ready':
@@ -245,18 +318,20 @@ class FRCHTMLHandler(adsk.core.HTMLEventHandler):
             elif action == 'insertPart':
                 try:
                     payload = json.loads(data) if data else {}
-                    idx = int(payload.get('index', -1))
+                    dfid = str(payload.get('id', ''))
                 except Exception:
-                    idx = -1
+                    dfid = ''
 
-                cots_files = database_thread.get_sorted_database_list()
-                if idx < 0 or idx >= len(cots_files):
-                    ui.messageBox('Invalid part index from HTML.')
+                part = database_thread.get_database_part(dfid)
+                if not part:
+                    ui.messageBox('Invalid part id from HTML.')
                     return
 
-                path, label, data_file_id, icon_name = cots_files[idx]
+                path, label, data_file_id = part
+                icon_name = get_icon_filename(data_file_id)
 
-                dataFile = database_thread.get_data_file( path, data_file_id )
+                with g_metrics.timer('insert.get_data_file'):
+                    dataFile = database_thread.get_data_file( path, data_file_id )
                 isSpacer = setJoint.is_dataFile_spacer(dataFile)
 
                 if isSpacer:
@@ -276,6 +351,16 @@ class FRCHTMLHandler(adsk.core.HTMLEventHandler):
                 # insert_part_at_targets(design, path, label, data_file_id, targets, ui)
                 return
 
+            # HTML stats view asks for the metrics
+            elif action == 'requestStats':
+                send_stats_to_palette(palette)
+
+            # HTML stats view starts or stops profiling the add-in
+            elif action == 'toggleProfiling':
+                profileCmd = ui.commandDefinitions.itemById(config.PROFILE_CMD_ID)
+                if profileCmd:
+                    profileCmd.execute()
+
             # User navigated to a new folder
             elif action == 'folderRequest':
                 folder = '/' + data
@@ -283,21 +368,19 @@ class FRCHTMLHandler(adsk.core.HTMLEventHandler):
                     folder = folder + '/'
                 futil.log( f'FRCHTMLHandler() -- Folder request for "{folder}"')
                 database_thread.load_folder( folder )
-                send_parts_to_palette(palette)
+                notify_palette_of_changes(palette)
                 
             # HTML toggles favorite state for a part
             elif action == 'toggleFavorite':
                 try:
                     payload = json.loads(data) if data else {}
-                    idx = int(payload.get('index', -1))
+                    dfid = str(payload.get('id', ''))
                     fav = bool(payload.get('favorite', False))
                 except Exception:
-                    idx = -1
+                    dfid = ''
                     fav = False
 
-                cots_files = database_thread.get_sorted_database_list()
-                if 0 <= idx < len(cots_files):
-                    _, _label, dfid, _thumbidx = cots_files[idx]
+                if database_thread.get_database_part(dfid):
                     g_favorites[dfid] = fav
                     save_favorites()
             elif action == "response":
@@ -352,9 +435,13 @@ class ShowPaletteCreatedHandler(adsk.core.CommandCreatedEventHandler):
 
         # Also call this line in the 'ready' message of FRCHTMLHandler()
         if not palette_just_created:
-            send_parts_to_palette(palette)
+            notify_palette_of_changes(palette)
 
 def run(context):
+    with g_tracer.span('addin.run'):
+        start_addin()
+
+def start_addin():
     try:
 
         if not _ensure_file_paths_exist():
@@ -423,6 +510,9 @@ def stop(context):
             g_dbThread.stop()
             g_dbThread.join()
 
+        # Write the spans of the insert commands run since the thread saved
+        g_tracer.save()
+
         # Remove the toolbar button
         solid_ws = ui.workspaces.itemById('FusionSolidEnvironment')
         panels = solid_ws.toolbarPanels
@@ -0,0 +1,22 @@
+"""Imports the add-in's modules outside of Fusion for the benchmarks.
+
+Puts the fake adsk package in fake_adsk on the path so the add-in's
+modules import without Fusion.
+"""
+
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_ADSK = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_adsk')
+sys.path.insert(0, FAKE_ADSK)
+
+def load_addin_module(name):
+    # The add-in is a package with relative imports but its folder name
+    # (FRC-COTS) can't be imported, so map it to a package called 'frc'.
+    if 'frc' not in sys.modules:
+        pkg = types.ModuleType('frc')
+        pkg.__path__ = [ROOT]
+        sys.modules['frc'] = pkg
+    return __import__(f'frc.{name}', fromlist=[name])
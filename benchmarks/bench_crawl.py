@@ -0,0 +1,158 @@
+"""End to end timings of the DatabaseThread on a synthetic parts library.
+
+Runs the DatabaseThread against the fake adsk package in fake_adsk with a
+project of each size and reports:
+
+    cold      seconds to build the index from nothing (until 'Idle.')
+    shown     seconds until a warm start has the index from disk to show
+    warm      seconds until a warm start has checked the root folder
+    peak MB   peak Python memory of the cold build and the warm start
+    events    events posted to the main thread / actually fired
+
+Thumbnails are requested while the index is built but not waited for.
+Each size is run in a fresh process.  Run from the add-in folder:
+
+    python benchmarks/bench_crawl.py [--latency SECONDS] [--workers N] [number of parts ...]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+import subprocess
+
+from addin_loader import load_addin_module
+
+def event_counts(app):
+    counts = {}
+    for info in app.events:
+        action = json.loads(info)['action']
+        counts[action] = counts.get(action, 0) + 1
+    return counts
+
+def run_thread(dt, app, memory: bool, timeout: float):
+    # Start a DatabaseThread and wait until it reports 'Idle.'
+    app.events.clear()
+    posted = dt.g_event_bus.posted
+    dispatched = dt.g_event_bus.dispatched
+    if memory:
+        tracemalloc.start()
+
+    # The globals still hold the database of the last run
+    dt.g_parts_db = None
+    thread = dt.DatabaseThread()
+    start = time.perf_counter()
+    shown = None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        thread.start()
+        while time.perf_counter() - start < timeout:
+            db = dt.g_parts_db
+            if shown is None and db and db.is_built() and db.get_part_count():
+                shown = time.perf_counter() - start
+            if any('Idle.' in info for info in app.events):
+                break
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - start
+        thread.stop()
+        thread.join()
+
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return { 'seconds': elapsed,
+             'shown': shown,
+             'peak': peak,
+             'parts': dt.g_parts_db.get_part_count(),
+             'thumbnails': dt.g_parts_db_io.thumbnails.submitted,
+             'posted': dt.g_event_bus.posted - posted,
+             'dispatched': dt.g_event_bus.dispatched - dispatched,
+             'events': event_counts(app) }
+
+def run_size(parts: int, args):
+    # Runs in a child process (see main) so every size starts clean
+    import adsk.core
+    config = load_addin_module('config')
+    db_path = tempfile.mkdtemp(prefix='frc_cots_bench_')
+    config.PARTS_DB_PATH = db_path
+    config.FOLDER_LISTING_WORKERS = args.workers
+    os.mkdir(os.path.join(db_path, 'icons'))
+
+    adsk.core.latency.listing = args.latency
+    adsk.core.latency.lookup = args.latency
+    adsk.core.latency.thumbnail = args.thumbnail_delay
+    adsk.core.make_project(config.PARTS_DB_PROJECT, parts, args.files_per_folder, args.fan_out)
+
+    app = adsk.core.Application.get()
+    dt = load_addin_module('database_thread')
+    try:
+        cold = run_thread(dt, app, False, args.timeout)
+        warm = run_thread(dt, app, False, args.timeout)
+        if args.memory:
+            # Measured separately since tracing allocations slows things down
+            shutil.rmtree(db_path)
+            os.mkdir(db_path)
+            os.mkdir(os.path.join(db_path, 'icons'))
+            cold['peak'] = run_thread(dt, app, True, args.timeout)['peak']
+            warm['peak'] = run_thread(dt, app, True, args.timeout)['peak']
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+    return {'parts': parts, 'cold': cold, 'warm': warm}
+
+def megabytes(n):
+    return f'{n / 1e6:.1f}' if n is not None else '-'
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the DatabaseThread on a synthetic parts library')
+    parser.add_argument('sizes', nargs='*', type=int, default=[1000, 10000, 50000],
+                        help='number of parts in the library')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds per cloud listing or lookup')
+    parser.add_argument('--thumbnail-delay', type=float, default=0.0,
+                        help='seconds until a thumbnail is ready')
+    parser.add_argument('--files-per-folder', type=int, default=25)
+    parser.add_argument('--fan-out', type=int, default=6)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='config.FOLDER_LISTING_WORKERS')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='skip the runs that measure peak memory')
+    parser.add_argument('--timeout', type=float, default=600.0)
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_size(args.sizes[0], args)))
+        return
+
+    results = []
+    print(f'{"parts":>7} {"cold s":>8} {"shown s":>8} {"warm s":>8} {"cold MB":>8} {"warm MB":>8} '
+          f'{"events cold":>12} {"events warm":>12}')
+    for size in args.sizes:
+        child = [sys.executable, os.path.abspath(__file__), '--child', str(size),
+                 '--latency', str(args.latency), '--thumbnail-delay', str(args.thumbnail_delay),
+                 '--files-per-folder', str(args.files_per_folder), '--fan-out', str(args.fan_out),
+                 '--workers', str(args.workers), '--timeout', str(args.timeout)]
+        if not args.memory:
+            child.append('--no-memory')
+        out = subprocess.run(child, capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        results.append(result)
+        cold = result['cold']
+        warm = result['warm']
+        print(f'{size:>7} {cold["seconds"]:>8.2f} {warm["shown"] or 0:>8.3f} {warm["seconds"]:>8.2f} '
+              f'{megabytes(cold["peak"]):>8} {megabytes(warm["peak"]):>8} '
+              f'{cold["posted"]:>5}/{cold["dispatched"]:<6} {warm["posted"]:>5}/{warm["dispatched"]:<6}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Memory used per part by the in-memory parts index.
+
+Builds the part entries, the folder index and the sorted list the way the
+PartsDatabase holds them after loading the SQLite store.  Each run does this
+twice: once with the old layout (a dict per part holding its own copy of
+the folder path and the absolute icon filename, and 4-tuples in the sorted
+list) and once with PartEntry records (slotted, interned folder paths,
+icon derived from the id).  Run from the add-in folder:
+
+    python benchmarks/bench_memory.py [number of parts ...]
+"""
+
+import os
+import sys
+import tracemalloc
+
+from addin_loader import load_addin_module
+
+parts_store = load_addin_module('parts_store')
+
+PARTS_PER_FOLDER = 40
+ICON_FOLDER = os.path.join(os.path.expanduser('~'), 'AppData', 'Roaming', 'FRC-COTS', 'icons')
+
+def make_rows(count):
+    # (id, path, name, version, modified) like the rows read from the store
+    rows = []
+    for i in range(count):
+        folder = i // PARTS_PER_FOLDER
+        path = f'/Vendor {folder % 17}/Category {folder % 61}/Group {folder}/'
+        name = f'am-{i:05d} Hex Bearing 1/2in x {i % 9 + 1}in'
+        id = f'urn:adsk.wipprod:dm.lineage:{i:012d}-AbCdEfGh'
+        rows.append((id, path, name, i % 7 + 1, 1700000000 + i))
+    return rows
+
+def old_icon_name(path, name):
+    flat_path = path.replace('/', '_')
+    safe_name = ''.join(c for c in name if c.isalnum())
+    return os.path.join(ICON_FOLDER, f'{flat_path}{safe_name}.png')
+
+def build_old(rows):
+    parts = {}
+    paths = {}
+    for id, path, name, version, modified in rows:
+        # Every row read from the store has its own copy of the path
+        path = (path + ' ')[:-1]
+        parts[id] = {'path': path, 'name': name, 'version': version,
+                     'modified': modified, 'icon': old_icon_name(path, name)}
+        paths.setdefault(path, set()).add(id)
+    sorted_parts = sorted((p['path'], p['name'], id, p['icon']) for id, p in parts.items())
+    return parts, paths, sorted_parts
+
+def build_new(rows):
+    parts = {}
+    paths = {}
+    for id, path, name, version, modified in rows:
+        part = parts_store.PartEntry((path + ' ')[:-1], name, version, modified)
+        parts[id] = part
+        paths.setdefault(part.path, set()).add(id)
+    sorted_parts = sorted((p.path, p.name, id) for id, p in parts.items())
+    return parts, paths, sorted_parts
+
+def measure(build, rows):
+    # Bytes allocated by build() that are still held by the index
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    index = build(rows)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del index
+    return used
+
+def main(counts):
+    print(f'{"parts":>8} {"old bytes/part":>15} {"new bytes/part":>15} {"saved":>7}')
+    for count in counts:
+        rows = make_rows(count)
+        old = measure(build_old, rows)
+        new = measure(build_new, rows)
+        print(f'{count:>8} {old / count:>15.0f} {new / count:>15.0f} {1 - new / old:>7.0%}')
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 50000])
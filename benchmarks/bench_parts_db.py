@@ -0,0 +1,319 @@
+"""Micro-benchmarks of the in-memory PartsDatabase operations.
+
+Each bench_* function sets up a PartsDatabase (with a real SQLite store in
+a temporary folder and a stub in place of PartsDatabaseFileIO) and returns
+the operation to time and the number of operations it does (parts added,
+lists requested...).  Every benchmark runs several rounds with a fresh
+setup and the best round is kept, as microseconds per operation.
+
+The results are compared with baseline_parts_db.json and the run fails
+(exit status 1) if any operation is more than --threshold slower.  Save a
+new baseline with --save after a change that is meant to be slower or
+faster.  Timings depend on the machine and vary by a third from run to
+run on a busy one, so two things keep the comparison honest:
+
+  - A calibration workload (SQLite inserts and sorting tuples, nothing
+    from the add-in) is timed in the same run and saved with the
+    baseline.  The baseline is scaled by how much faster or slower the
+    calibration is now, so the comparison works on another machine.
+  - A benchmark over the threshold is run again up to --retries times
+    and only fails if its best time is still over.
+
+Run from the add-in folder:
+
+    python benchmarks/bench_parts_db.py [--parts N] [--threshold 0.5] [--save] [name ...]
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+from addin_loader import load_addin_module
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baseline_parts_db.json')
+PARTS_PER_FOLDER = 25
+# The calibration is short so it takes more rounds for a steady best time
+CALIBRATION_ROUNDS = 15
+
+import adsk.core
+config = load_addin_module('config')
+dt = load_addin_module('database_thread')
+
+class StubFileIO:
+    # The parts of PartsDatabaseFileIO the PartsDatabase calls, without
+    # the cloud
+    def __init__(self):
+        self.project = None
+        self.folder_ids = {}
+
+    def set_project(self, project):
+        self.project = project
+
+    def set_folder_ids(self, folder_ids: dict):
+        self.folder_ids = folder_ids
+
+    def update_folder_id(self, path: str, folder_id: str) -> bool:
+        if self.folder_ids.get(path) == folder_id:
+            return False
+        self.folder_ids[path] = folder_id
+        return True
+
+    def forget_folder_ids(self, paths: list):
+        for path in paths:
+            self.folder_ids.pop(path, None)
+
+    def forget_data_file(self, id):
+        pass
+
+    def close(self):
+        pass
+
+def part_rows(count):
+    # (id, path, name, version, modified) of count parts
+    rows = []
+    for i in range(count):
+        folder = i // PARTS_PER_FOLDER
+        path = f'/Vendor {folder % 7}/Category {folder % 31}/Group {folder}/'
+        rows.append((f'urn:adsk.wipprod:dm.lineage:{i:012d}', path,
+                     f'am-{i:05d} Hex Bearing 1/2in x {i % 9 + 1}in', i % 5 + 1, 1700000000 + i))
+    return rows
+
+def new_database():
+    # A PartsDatabase with an empty store in a new temporary folder
+    config.PARTS_DB_PATH = tempfile.mkdtemp(prefix='frc_cots_bench_')
+    os.mkdir(os.path.join(config.PARTS_DB_PATH, 'icons'))
+    return dt.PartsDatabase(StubFileIO())
+
+def filled_database(rows):
+    db = new_database()
+    with db.store.transaction():
+        for row in rows:
+            db.add_part(*row)
+    return db
+
+def folder_records(rows):
+    # FolderRecords with the files of rows, like a crawl lists them
+    project = adsk.core.DataProject(config.PARTS_DB_PROJECT)
+    root = dt.FolderRecord('', project.rootFolder, None)
+    records = {}
+    for id, path, name, version, modified in rows:
+        rec = records.get(path)
+        if not rec:
+            parent = root
+            for folder_name in path.strip('/').split('/'):
+                child = parent.get_child(folder_name)
+                if not child:
+                    child = dt.FolderRecord(folder_name, adsk.core.DataFolder(folder_name, None, project), parent)
+                    parent.add_child(child)
+                parent = child
+            rec = records[path] = parent
+        df = adsk.core.DataFile(name, rec._dataFolder)
+        df.id = id
+        df.versionNumber = version
+        df.dateModified = modified
+        rec.add_file(dt.FileRecord(df, rec))
+    return list(records.values())
+
+# Each benchmark returns (operation, number of operations it does)
+
+def bench_add_part(rows):
+    db = new_database()
+    def run():
+        with db.store.transaction():
+            for row in rows:
+                db.add_part(*row)
+    return run, len(rows)
+
+def bench_add_part_unchanged(rows):
+    # Revalidating a folder adds all of its parts again
+    db = filled_database(rows)
+    def run():
+        with db.store.transaction():
+            for row in rows:
+                db.add_part(*row)
+    return run, len(rows)
+
+def bench_remove_part_at_path(rows):
+    db = filled_database(rows)
+    def run():
+        with db.store.transaction():
+            for id, path, *_ in rows:
+                db.remove_part_at_path(id, path)
+    return run, len(rows)
+
+def bench_sync_record_with_database(rows):
+    # First sync of every folder of a crawl
+    db = new_database()
+    records = folder_records(rows)
+    def run():
+        for rec in records:
+            db.sync_record_with_database(rec)
+    return run, len(rows)
+
+def bench_sync_record_unchanged(rows):
+    # Revalidation of folders that did not change
+    records = folder_records(rows)
+    db = new_database()
+    for rec in records:
+        db.sync_record_with_database(rec)
+    def run():
+        for rec in records:
+            db.sync_record_with_database(rec)
+    return run, len(rows)
+
+def bench_get_sorted_list(rows):
+    # The palette asks for the list after every change
+    db = filled_database(rows)
+    changes = rows[:100]
+    def run():
+        for id, path, name, version, modified in changes:
+            db.add_part(id, path, name, version + 1, modified)
+            db.get_sorted_list()
+    return run, len(changes)
+
+def bench_load_database_file(rows):
+    db = filled_database(rows)
+    db.build_complete()
+    db.save_database_file()
+    db.close()
+    def run():
+        dt.PartsDatabase(StubFileIO()).close()
+    return run, len(rows)
+
+def bench_save_database_file(rows):
+    db = filled_database(rows)
+    def run():
+        for i in range(100):
+            db.build_complete()
+            db.save_database_file()
+    return run, 100
+
+def bench_migrate_json_file(rows):
+    # First start after upgrading from the JSON parts database
+    db = new_database()
+    db.close()
+    parts = {id: {'path': path, 'name': name, 'version': version, 'icon': ''}
+             for id, path, name, version, modified in rows}
+    database = {'built': True, 'build_date': '01/01/24 00:00:00.000000',
+                'project': {'name': config.PARTS_DB_PROJECT, 'id': ''},
+                'parts': parts, 'paths': sorted(set(row[1] for row in rows))}
+    os.remove(os.path.join(config.PARTS_DB_PATH, dt.PartsDatabase.SQLITE_FILE))
+    with open(os.path.join(config.PARTS_DB_PATH, dt.PartsDatabase.JSON_FILE), 'w') as f:
+        json.dump(database, f)
+    def run():
+        dt.PartsDatabase(StubFileIO()).close()
+    return run, len(rows)
+
+BENCHMARKS = {name[len('bench_'):]: fn for name, fn in globals().items() if name.startswith('bench_')}
+
+def calibration(rows):
+    # Work like the benchmarks' without the add-in's code, timed to
+    # scale the baseline to this machine
+    def run():
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE parts (id TEXT PRIMARY KEY, path TEXT, name TEXT, version INTEGER, modified INTEGER)')
+        with conn:
+            conn.executemany('INSERT INTO parts VALUES (?, ?, ?, ?, ?)', rows)
+        loaded = conn.execute('SELECT path, name, id FROM parts').fetchall()
+        conn.close()
+        sorted(loaded, key=lambda row: (row[1], row[0]))
+    # run_benchmark removes PARTS_DB_PATH after each round
+    config.PARTS_DB_PATH = tempfile.mkdtemp(prefix='frc_cots_bench_')
+    return run, len(rows)
+
+def run_benchmark(fn, rows, rounds: int) -> float:
+    # Best microseconds per operation over the rounds
+    best = None
+    for _ in range(rounds):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            run, count = fn(rows)
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+        shutil.rmtree(config.PARTS_DB_PATH, ignore_errors=True)
+        per_op = elapsed * 1e6 / count
+        if best is None or per_op < best:
+            best = per_op
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the PartsDatabase operations')
+    parser.add_argument('names', nargs='*', help=f'benchmarks to run ({", ".join(BENCHMARKS)})')
+    parser.add_argument('--parts', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='fraction slower than the baseline that fails')
+    parser.add_argument('--retries', type=int, default=3,
+                        help='times a benchmark over the threshold is run again')
+    parser.add_argument('--save', action='store_true', help='save the results as the baseline')
+    args = parser.parse_args()
+
+    baseline = {}
+    baseline_calibration = None
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, 'r') as f:
+            saved = json.load(f)
+        if saved['parts'] == args.parts:
+            baseline = saved['results']
+            baseline_calibration = saved.get('calibration')
+        else:
+            print(f'Baseline is for {saved["parts"]} parts, not comparing.')
+
+    rows = part_rows(args.parts)
+    names = args.names or list(BENCHMARKS)
+    results = {name: run_benchmark(BENCHMARKS[name], rows, args.rounds) for name in names}
+
+    # The machine's speed is the best calibration of the run: measured
+    # after the benchmarks and again before every retry
+    calibration_us = run_benchmark(calibration, rows, CALIBRATION_ROUNDS)
+    if args.save:
+        # The saved one has to be as steady as the best of all the runs compared with it
+        for _ in range(2):
+            calibration_us = min(calibration_us, run_benchmark(calibration, rows, CALIBRATION_ROUNDS))
+    scale = calibration_us / baseline_calibration if baseline_calibration else 1.0
+
+    failed = []
+    for retry in range(args.retries + 1):
+        failed = [name for name in names
+                  if baseline.get(name) and results[name] / (baseline[name] * scale) - 1 > args.threshold]
+        if not failed or retry == args.retries:
+            break
+        calibration_us = min(calibration_us, run_benchmark(calibration, rows, CALIBRATION_ROUNDS))
+        scale = calibration_us / baseline_calibration if baseline_calibration else 1.0
+        for name in failed:
+            results[name] = min(results[name], run_benchmark(BENCHMARKS[name], rows, args.rounds))
+
+    if baseline_calibration:
+        print(f'Calibration {calibration_us:.2f} us/op, {scale:.2f} x the baseline machine')
+    print(f'{"benchmark":<28} {"us/op":>9} {"baseline":>9} {"change":>8}')
+    for name in names:
+        us = results[name]
+        base = baseline.get(name)
+        if base:
+            # The baseline as it would run on this machine
+            base *= scale
+            status = 'FAIL' if name in failed else ''
+            print(f'{name:<28} {us:>9.2f} {base:>9.2f} {us / base - 1:>+8.0%} {status}')
+        else:
+            print(f'{name:<28} {us:>9.2f} {"-":>9}')
+    results = {name: round(us, 3) for name, us in results.items()}
+
+    if args.save:
+        results = {**baseline, **results}
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump({'parts': args.parts, 'calibration': round(calibration_us, 3),
+                       'results': results}, f, indent=1)
+        print(f'Saved the baseline to {BASELINE_FILE}')
+    elif failed:
+        print(f'{len(failed)} benchmarks more than {args.threshold:.0%} slower than the baseline: {", ".join(failed)}')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
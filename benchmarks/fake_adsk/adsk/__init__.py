@@ -0,0 +1,3 @@
+# Stand-in for the parts of Fusion's adsk package that the add-in's database
+# code uses, so it can run (and be benchmarked) outside of Fusion.  Put the
+# fake_adsk folder on sys.path before importing the add-in.
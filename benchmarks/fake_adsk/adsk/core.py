@@ -0,0 +1,255 @@
+import time
+import itertools
+
+# The cloud data API (Application.data, DataProject, DataFolder, DataFile
+# and thumbnail futures) backed by an in-memory tree of folders and files.
+# Every call that would be a round trip to the cloud sleeps for the time
+# set in latency so crawls can be timed with realistic delays.  Names the
+# add-in uses that aren't defined here resolve to do-nothing classes.
+
+class Latency:
+    def __init__(self):
+        self.listing = 0.0          # Seconds per dataFolders / dataFiles listing
+        self.lookup = 0.0           # Seconds per find...ById / itemById
+        self.thumbnail = 0.0        # Seconds until a thumbnail future finishes
+        self.thumbnail_failures = 0 # Every nth thumbnail fails (0 for none)
+
+latency = Latency()
+
+def _round_trip(seconds: float):
+    if seconds > 0:
+        time.sleep(seconds)
+
+class LogLevels:
+    InfoLogLevel = 0
+    WarningLogLevel = 1
+    ErrorLogLevel = 2
+
+class LogTypes:
+    ConsoleLogType = 0
+    FileLogType = 1
+
+class FutureStates:
+    ProcessingFutureState = 0
+    FinishedFutureState = 1
+    FailedFutureState = 2
+
+class PaletteDockingStates:
+    PaletteDockStateRight = 0
+
+class Base:
+    @classmethod
+    def cast(cls, obj):
+        return obj
+
+class Anything(Base):
+    # Any attribute or call (e.g. app.userInterface.messageBox())
+    def __getattr__(self, name):
+        return Anything()
+
+    def __call__(self, *args, **kwargs):
+        return Anything()
+
+    def __bool__(self):
+        return False
+
+class DataObject(Base):
+    def saveToFile(self, filename: str) -> bool:
+        with open(filename, 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n')
+        return True
+
+class DataObjectFuture(Base):
+    def __init__(self, delay: float, fail: bool):
+        self.finish_time = time.time() + delay
+        self.fail = fail
+
+    @property
+    def state(self):
+        if time.time() < self.finish_time:
+            return FutureStates.ProcessingFutureState
+        if self.fail:
+            return FutureStates.FailedFutureState
+        return FutureStates.FinishedFutureState
+
+    @property
+    def dataObject(self):
+        if self.state == FutureStates.FinishedFutureState:
+            return DataObject()
+        return None
+
+class Collection(list):
+    def itemByName(self, name: str):
+        for item in self:
+            if item.name == name:
+                return item
+        return None
+
+    def itemById(self, id: str):
+        _round_trip(latency.lookup)
+        for item in self:
+            if item.id == id:
+                return item
+        return None
+
+    def item(self, index: int):
+        return self[index]
+
+    @property
+    def count(self) -> int:
+        return len(self)
+
+_ids = itertools.count(1)
+_thumbnails = itertools.count(1)
+
+class DataFile(Base):
+    __slots__ = ('name', 'id', 'parentFolder', 'fileExtension', 'versionNumber', 'dateModified',
+                 'thumbnail_results')
+
+    def __init__(self, name: str, folder: 'DataFolder', extension: str = 'f3d', version: int = 1):
+        self.name = name
+        self.id = f'urn:adsk.wipprod:dm.lineage:{next(_ids):010d}'
+        self.parentFolder = folder
+        self.fileExtension = extension
+        self.versionNumber = version
+        self.dateModified = 1700000000
+        # (seconds, ok) of each thumbnail request in turn instead of
+        # latency.thumbnail.  The last one repeats.
+        self.thumbnail_results = None
+
+    @property
+    def thumbnail(self) -> DataObjectFuture:
+        if self.thumbnail_results:
+            seconds, ok = self.thumbnail_results[0]
+            if len(self.thumbnail_results) > 1:
+                self.thumbnail_results = self.thumbnail_results[1:]
+            return DataObjectFuture(seconds, not ok)
+        n = next(_thumbnails)
+        fail = latency.thumbnail_failures > 0 and n % latency.thumbnail_failures == 0
+        return DataObjectFuture(latency.thumbnail, fail)
+
+class DataFolder(Base):
+    def __init__(self, name: str, parent: 'DataFolder', project: 'DataProject'):
+        self.name = name
+        self.id = f'urn:adsk.wipprod:fs.folder:{next(_ids):010d}'
+        self.parentFolder = parent
+        self.parentProject = project
+        self.folders = Collection()
+        self.files = Collection()
+        # Seconds the listings of this folder take instead of latency.listing
+        self.folders_latency = None
+        self.files_latency = None
+
+    @property
+    def dataFolders(self) -> Collection:
+        _round_trip(latency.listing if self.folders_latency is None else self.folders_latency)
+        return Collection(self.folders)
+
+    @property
+    def dataFiles(self) -> Collection:
+        _round_trip(latency.listing if self.files_latency is None else self.files_latency)
+        return Collection(self.files)
+
+    def add_folder(self, name: str) -> 'DataFolder':
+        folder = DataFolder(name, self, self.parentProject)
+        self.folders.append(folder)
+        Application.get().data.folders_by_id[folder.id] = folder
+        return folder
+
+    def add_file(self, name: str, extension: str = 'f3d') -> DataFile:
+        df = DataFile(name, self, extension)
+        self.files.append(df)
+        Application.get().data.files_by_id[df.id] = df
+        return df
+
+class DataProject(Base):
+    def __init__(self, name: str):
+        self.name = name
+        self.id = f'a.project:{next(_ids):010d}'
+        self.rootFolder = DataFolder('root', None, self)
+        Application.get().data.folders_by_id[self.rootFolder.id] = self.rootFolder
+
+class Data(Base):
+    def __init__(self):
+        self.dataProjects = Collection()
+        self.folders_by_id = {}
+        self.files_by_id = {}
+
+    def findFileById(self, id: str) -> DataFile:
+        _round_trip(latency.lookup)
+        return self.files_by_id.get(id)
+
+    def findFolderById(self, id: str) -> DataFolder:
+        _round_trip(latency.lookup)
+        return self.folders_by_id.get(id)
+
+class Application(Base):
+    _app = None
+
+    def __init__(self):
+        self.userInterface = Anything()
+        self.data = Data()
+        self.isStartupComplete = True
+        self.events = []            # additionalInfo of every fired custom event
+
+    @staticmethod
+    def get() -> 'Application':
+        if Application._app is None:
+            Application._app = Application()
+        return Application._app
+
+    def log(self, message, level = None, log_type = None):
+        pass
+
+    def registerCustomEvent(self, name: str):
+        return Anything()
+
+    def fireCustomEvent(self, name: str, additionalInfo: str = '') -> bool:
+        self.events.append(additionalInfo)
+        return True
+
+class EventHandler:
+    def __init__(self):
+        pass
+
+class ApplicationEventHandler(EventHandler):
+    pass
+
+class CustomEventHandler(EventHandler):
+    pass
+
+class HTMLEventHandler(EventHandler):
+    pass
+
+class CommandCreatedEventHandler(EventHandler):
+    pass
+
+def __getattr__(name: str):
+    # Event args, inputs and the other types that only appear in annotations
+    cls = type(name, (Base,), {})
+    globals()[name] = cls
+    return cls
+
+def make_project(name: str, parts: int, files_per_folder: int = 25, fan_out: int = 6) -> DataProject:
+    """Add a project with about 'parts' f3d files to Application.data.  Folders
+    are added breadth first with fan_out subfolders each and every folder
+    below the root holds files_per_folder parts and one non-f3d file."""
+    project = DataProject(name)
+    Application.get().data.dataProjects.append(project)
+
+    queue = [project.rootFolder]
+    count = 0
+    head = 0
+    while count < parts:
+        parent = queue[head]
+        head += 1
+        for i in range(fan_out):
+            if count >= parts:
+                break
+            folder = parent.add_folder(f'{parent.name[:12]} {i}' if parent.parentFolder else f'Vendor {i}')
+            for j in range(min(files_per_folder, parts - count)):
+                folder.add_file(f'{folder.name} part {j:03d}')
+                count += 1
+            folder.add_file(f'{folder.name} drawing', 'pdf')
+            queue.append(folder)
+    return project
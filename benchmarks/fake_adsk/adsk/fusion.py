@@ -0,0 +1,16 @@
+from .core import Base
+
+class Occurrence(Base):
+    pass
+
+class Design(Base):
+    pass
+
+class Component(Base):
+    pass
+
+class TimelineGroup(Base):
+    pass
+
+class TemporaryBRepManager(Base):
+    pass
@@ -0,0 +1,93 @@
+"""Replay a recorded cloud trace through the DatabaseThread offline.
+
+Builds the folder tree of a trace written with config.RECORD_CLOUD_TRACE
+in the fake adsk package.  Every folder's listings take the time they took
+when recorded and every thumbnail request gets the recorded result after
+the recorded delay.  Then the DatabaseThread crawls it like bench_crawl.py
+does (cold build, then a warm start), so changes to the crawl or the
+thumbnail scheduler can be timed on a real library's shape without Fusion
+or a network.  Run from the add-in folder:
+
+    python benchmarks/replay_crawl.py [--scale 1.0] [--workers N] cloud_trace_<time>.jsonl
+"""
+
+import os
+import shutil
+import argparse
+import tempfile
+
+from addin_loader import load_addin_module
+from bench_crawl import run_thread, megabytes
+
+import adsk.core
+
+def build_project(name: str, trace_filename: str, scale: float):
+    # Returns the project and the number of f3d files in it
+    cloud_trace = load_addin_module('cloud_trace')
+    root_id, folders, thumbnails = cloud_trace.load_cloud_trace(trace_filename)
+    if not root_id:
+        raise ValueError(f'{trace_filename} has no project')
+
+    project = adsk.core.DataProject(name)
+    adsk.core.Application.get().data.dataProjects.append(project)
+
+    parts = 0
+    stack = [(root_id, project.rootFolder)]
+    while stack:
+        id, dataFolder = stack.pop()
+        folder = folders.get(id)
+        if not folder:
+            # Never listed while recording
+            continue
+        if folder.folders_seconds is not None:
+            dataFolder.folders_latency = folder.folders_seconds * scale
+        if folder.files_seconds is not None:
+            dataFolder.files_latency = folder.files_seconds * scale
+        for child_id in folder.folders:
+            child = folders.get(child_id)
+            name = child.name if child and child.name else child_id
+            stack.append((child_id, dataFolder.add_folder(name)))
+        for file_id, name, extension, version, modified in folder.files:
+            df = dataFolder.add_file(name, extension)
+            df.versionNumber = version
+            df.dateModified = modified
+            results = thumbnails.get(file_id)
+            if results:
+                df.thumbnail_results = [(seconds * scale, ok) for seconds, ok in results]
+            parts += 1
+    return project, parts
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a cloud trace through the DatabaseThread')
+    parser.add_argument('trace', help='cloud_trace_<time>.jsonl file')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiply the recorded times by this (0 for no waiting)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='config.FOLDER_LISTING_WORKERS')
+    parser.add_argument('--memory', action='store_true', help='also measure peak memory')
+    parser.add_argument('--timeout', type=float, default=3600.0)
+    args = parser.parse_args()
+
+    config = load_addin_module('config')
+    db_path = tempfile.mkdtemp(prefix='frc_cots_replay_')
+    config.PARTS_DB_PATH = db_path
+    config.FOLDER_LISTING_WORKERS = args.workers
+    os.mkdir(os.path.join(db_path, 'icons'))
+
+    project, parts = build_project(config.PARTS_DB_PROJECT, args.trace, args.scale)
+    print(f'Replaying {args.trace}: {parts} parts, listing times x{args.scale}, {args.workers} workers')
+
+    app = adsk.core.Application.get()
+    dt = load_addin_module('database_thread')
+    try:
+        for label in ('cold', 'warm'):
+            result = run_thread(dt, app, args.memory, args.timeout)
+            shown = f', shown in {result["shown"]:.3f} s' if label == 'warm' and result['shown'] else ''
+            print(f'{label}: {result["seconds"]:.2f} s{shown}, {result["parts"]} parts, '
+                  f'{result["thumbnails"]} thumbnails requested, peak {megabytes(result["peak"])} MB, '
+                  f'events {result["posted"]} posted / {result["dispatched"]} fired')
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import os
+import time
+import json
+import threading
+
+from .lib import fusionAddInUtils as futil
+from . import config
+
+# Recording of the cloud traffic of a crawl.
+# With config.RECORD_CLOUD_TRACE on, the PartsDatabaseFileIO writes every
+# folder listing (the child folders and f3d files it returned and how long
+# it took) and every thumbnail result to a trace file in PARTS_DB_PATH, one
+# JSON object per line.  Folder and file names and ids are replaced with
+# made up ones so the trace shows the shape of a library without what is
+# in it and can be shared.  load_cloud_trace() reads a trace back as the
+# folder tree it describes so a crawl of that library can be replayed
+# offline (see benchmarks/replay_crawl.py).
+#
+# The lines of a trace are:
+#   {"op": "start", "version": 1, "time": ...}
+#   {"op": "project", "root": "d1"}
+#   {"op": "list", "t": ..., "folder": "d1", "seconds": ...,
+#    "folders": [["d2", "Folder 2"], ...] or null,
+#    "files": [["f1", "Part 1", "f3d", version, modified], ...] or null}
+#   {"op": "thumbnail", "t": ..., "file": "f1", "seconds": ..., "ok": true}
+
+TRACE_VERSION = 1
+
+class CloudTraceRecorder:
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.mutex = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.folder_ids = {}        # real id -> made up id
+        self.file_ids = {}
+        self.file = open(filename, 'w', buffering=1)    # Line buffered so a crash keeps the trace
+        self.write({'op': 'start', 'version': TRACE_VERSION, 'time': time.time()})
+
+    def folder_id(self, id: str) -> str:
+        # Must be called with the mutex held
+        anon = self.folder_ids.get(id)
+        if not anon:
+            anon = self.folder_ids[id] = f'd{len(self.folder_ids) + 1}'
+        return anon
+
+    def file_id(self, id: str) -> str:
+        # Must be called with the mutex held
+        anon = self.file_ids.get(id)
+        if not anon:
+            anon = self.file_ids[id] = f'f{len(self.file_ids) + 1}'
+        return anon
+
+    def write(self, entry: dict):
+        # Must be called with the mutex held (or from __init__)
+        if self.file:
+            self.file.write(json.dumps(entry) + '\n')
+
+    def project(self, rootFolder):
+        self.mutex.acquire()
+        self.write({'op': 'project', 'root': self.folder_id(rootFolder.id)})
+        self.mutex.release()
+
+    def listing(self, dataFolder, folders, files, seconds: float):
+        # folders or files is None when only the other was listed
+        self.mutex.acquire()
+        try:
+            entry = {'op': 'list', 't': time.perf_counter() - self.start_time,
+                     'folder': self.folder_id(dataFolder.id), 'seconds': seconds,
+                     'folders': None, 'files': None}
+            if folders is not None:
+                entry['folders'] = []
+                for df in folders:
+                    anon = self.folder_id(df.id)
+                    entry['folders'].append([anon, 'Folder ' + anon[1:]])
+            if files is not None:
+                entry['files'] = []
+                for df in files:
+                    anon = self.file_id(df.id)
+                    entry['files'].append([anon, 'Part ' + anon[1:], df.fileExtension,
+                                           df.versionNumber, df.dateModified])
+            self.write(entry)
+        except:
+            futil.handle_error('CloudTraceRecorder::listing() -- Could not record a listing.')
+        finally:
+            self.mutex.release()
+
+    def thumbnail(self, id: str, seconds: float, ok: bool):
+        self.mutex.acquire()
+        self.write({'op': 'thumbnail', 't': time.perf_counter() - self.start_time,
+                    'file': self.file_id(id), 'seconds': seconds, 'ok': ok})
+        self.mutex.release()
+
+    def close(self):
+        self.mutex.acquire()
+        if self.file:
+            self.file.close()
+            self.file = None
+        self.mutex.release()
+
+def start_recording():
+    # Returns a CloudTraceRecorder writing a new trace file or None
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    filename = os.path.join(config.PARTS_DB_PATH, f'cloud_trace_{stamp}.jsonl')
+    try:
+        recorder = CloudTraceRecorder(filename)
+    except OSError:
+        futil.handle_error(f'Could not create the cloud trace {filename}...')
+        return None
+    futil.log(f'Recording the cloud traffic to {filename}...')
+    return recorder
+
+class TraceFolder:
+    def __init__(self, id: str):
+        self.id = id
+        self.name = None
+        self.folders = []           # made up ids of the child folders
+        self.files = []             # [id, name, extension, version, modified]
+        self.folders_seconds = None # time the listings of each kind took
+        self.files_seconds = None
+
+def load_cloud_trace(filename: str):
+    """Read a trace written by CloudTraceRecorder.  Returns the id of the
+    root folder, the folders by id and the thumbnail results by file id
+    as lists of (seconds, ok) in the order they happened."""
+    root = None
+    folders = {}
+    thumbnails = {}
+
+    def get_folder(id):
+        folder = folders.get(id)
+        if not folder:
+            folder = folders[id] = TraceFolder(id)
+        return folder
+
+    with open(filename, 'r') as f:
+        for line in f:
+            entry = json.loads(line)
+            op = entry['op']
+            if op == 'start':
+                if entry['version'] != TRACE_VERSION:
+                    raise ValueError(f'{filename} is trace version {entry["version"]}, not {TRACE_VERSION}')
+            elif op == 'project':
+                root = entry['root']
+            elif op == 'list':
+                folder = get_folder(entry['folder'])
+                # A listing of both halves at once is split between them
+                both = entry['folders'] is not None and entry['files'] is not None
+                seconds = entry['seconds'] / 2 if both else entry['seconds']
+                if entry['folders'] is not None:
+                    folder.folders = [id for id, name in entry['folders']]
+                    for id, name in entry['folders']:
+                        get_folder(id).name = name
+                    if folder.folders_seconds is None:
+                        folder.folders_seconds = seconds
+                if entry['files'] is not None:
+                    folder.files = entry['files']
+                    if folder.files_seconds is None:
+                        folder.files_seconds = seconds
+            elif op == 'thumbnail':
+                thumbnails.setdefault(entry['file'], []).append((entry['seconds'], entry['ok']))
+
+    return root, folders, thumbnails
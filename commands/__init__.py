@@ -6,6 +6,7 @@
 from .makeSpacer import entry as makeSpacer
 from .insertSpacer import entry as insertSpacer
 from .insertPart import entry as insertPart
+from .profileSession import entry as profileSession
 # from .paletteShow import entry as paletteShow
 # from .paletteSend import entry as paletteSend
 
@@ -14,7 +15,8 @@ from .insertPart import entry as insertPart
 commands = [
     makeSpacer,
     insertSpacer,
-    insertPart
+    insertPart,
+    profileSession
 ]
 
 
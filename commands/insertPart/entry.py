@@ -3,6 +3,8 @@ import adsk.fusion
 import os
 from ...lib import fusionAddInUtils as futil
 from ... import config
+from ...metrics import g_metrics
+from ...tracer import traced
 app = adsk.core.Application.get()
 ui = app.userInterface
 
@@ -127,6 +129,7 @@ def command_execute(args: adsk.core.CommandEventArgs):
 
 
 # This event handler is called when the command needs to compute a new preview in the graphics window.
+@traced('insertPart.command_preview')
 def command_preview(args: adsk.core.CommandEventArgs):
     global g_dataFile
     global g_active_occ
@@ -162,13 +165,15 @@ def command_preview(args: adsk.core.CommandEventArgs):
             # A bug makes so you can only insert a linked component from another project
             # into the root component.  So we have to move it if a sub component
             # is the active component.
-            part_occ = root_occs.addByInsert( g_dataFile, transform, True )
+            with g_metrics.timer('insert.part_linked'):
+                part_occ = root_occs.addByInsert( g_dataFile, transform, True )
             if g_active_occ:
                 part_occ = part_occ.moveToComponent( g_active_occ )
 
         else:
             # Do not link component
-            part_occ = active_comp.occurrences.addByInsert( g_dataFile, transform, False )
+            with g_metrics.timer('insert.part'):
+                part_occ = active_comp.occurrences.addByInsert( g_dataFile, transform, False )
 
         joint_part(active_comp, target, part_occ, force_flip)
 
@@ -3,6 +3,8 @@ import adsk.fusion
 import os
 from ...lib import fusionAddInUtils as futil
 from ... import config
+from ...metrics import g_metrics
+from ...tracer import traced
 from ..insertPart.entry import joint_part, find_normal_centroid
 
 app = adsk.core.Application.get()
@@ -184,6 +186,7 @@ def command_preselect(args: adsk.core.SelectionEventArgs):
         args.isSelectable = False
 
 # This event handler is called when the command needs to compute a new preview in the graphics window.
+@traced('insertSpacer.command_preview')
 def command_preview(args: adsk.core.CommandEventArgs):
     global g_dataFile
     global g_active_occ
@@ -233,11 +236,12 @@ def command_preview(args: adsk.core.CommandEventArgs):
 
     transform = adsk.core.Matrix3D.create()
     occs = active_comp.occurrences
-    new_occ = occs.addByInsert(
-        g_dataFile,
-        transform,
-        False  # reference to original design
-    )
+    with g_metrics.timer('insert.spacer'):
+        new_occ = occs.addByInsert(
+            g_dataFile,
+            transform,
+            False  # reference to original design
+        )
 
     insert = design.timeline.item(start_timeline_pos)
     if insert.isGroup:
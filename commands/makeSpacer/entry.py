@@ -3,6 +3,7 @@ import adsk.fusion
 import os
 from ...lib import fusionAddInUtils as futil
 from ... import config
+from ...tracer import traced
 
 app = adsk.core.Application.get()
 ui = app.userInterface
@@ -209,6 +210,7 @@ def is_design_spacer(design: adsk.fusion.Design):
     
     return False
 
+@traced()
 def is_dataFile_spacer(dataFile: adsk.core.DataFile) -> bool:
     doc = app.documents.open(dataFile, False)
     design = doc.products.itemByProductType('DesignProductType')
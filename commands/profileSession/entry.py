@@ -0,0 +1,167 @@
+import adsk.core
+import os
+import time
+import cProfile
+import tracemalloc
+from ...lib import fusionAddInUtils as futil
+from ... import config
+from ... import database_thread
+app = adsk.core.Application.get()
+ui = app.userInterface
+
+
+# Hidden command that profiles a session of using the add-in.  Running it
+# the first time starts cProfile on the main thread and on the
+# DatabaseThread (one profiler covers both from Python 3.12 on) and starts
+# tracemalloc.  Running it again stops them and writes the profiles
+# (.pstats) and a report of the top memory allocations into
+# config.PARTS_DB_PATH.  It has no toolbar button; it is run from the
+# stats view of the palette.
+CMD_NAME = 'FRC_COTS Profile Session'
+CMD_Description = 'Start or stop profiling the FRC_COTS add-in'
+
+# Seconds to wait for the DatabaseThread to hand over its profile
+THREAD_STOP_TIMEOUT = 5.0
+
+# Local list of event handlers used to maintain a reference so
+# they are not released and garbage collected.
+local_handlers = []
+
+# The profiler of the main thread while a session is being profiled
+g_profiler = None
+g_start_time = 0.0
+# True if this command started tracemalloc (and so stops it)
+g_started_tracemalloc = False
+
+# Executed when add-in is run.
+def start():
+    # Create a command Definition.
+    cmd_def = ui.commandDefinitions.addButtonDefinition(
+        config.PROFILE_CMD_ID, CMD_NAME, CMD_Description, ''
+    )
+
+    # Define an event handler for the command created event.
+    futil.add_handler(cmd_def.commandCreated, command_created)
+
+
+# Executed when add-in is stopped.
+def stop():
+    # Don't leave the profilers running
+    if g_profiler:
+        stop_profiling()
+
+    # Get the cmddef for this command
+    command_definition = ui.commandDefinitions.itemById(config.PROFILE_CMD_ID)
+
+    # Delete the command definition
+    if command_definition:
+        command_definition.deleteMe()
+
+
+def is_profiling() -> bool:
+    return g_profiler is not None
+
+
+# The command has no dialog so Fusion runs the execute event right after this.
+def command_created(args: adsk.core.CommandCreatedEventArgs):
+    futil.log(f'{CMD_NAME} Command Created Event')
+    futil.add_handler(args.command.execute, command_execute, local_handlers=local_handlers)
+    futil.add_handler(args.command.destroy, command_destroy, local_handlers=local_handlers)
+
+
+def command_execute(args: adsk.core.CommandEventArgs):
+    futil.log(f'{CMD_NAME} Command Execute Event')
+
+    try:
+        if g_profiler:
+            files = stop_profiling()
+            ui.messageBox('Profiling stopped.  The results were saved to:\n' + '\n'.join(files), CMD_NAME)
+        else:
+            start_profiling()
+            ui.messageBox('Profiling started.  Use the add-in and then stop profiling '
+                          'from the stats view of the palette.', CMD_NAME)
+    except:
+        futil.handle_error(f'{CMD_NAME} failed.', True)
+
+
+def command_destroy(args: adsk.core.CommandEventArgs):
+    global local_handlers
+    local_handlers = []
+    futil.log(f'{CMD_NAME} Command Destroy Event')
+
+
+def start_profiling():
+    global g_profiler
+    global g_start_time
+    global g_started_tracemalloc
+
+    futil.log(f'{CMD_NAME} -- Starting the profilers...')
+    g_start_time = time.time()
+    g_started_tracemalloc = not tracemalloc.is_tracing()
+    if g_started_tracemalloc:
+        tracemalloc.start(config.PROFILE_TRACEMALLOC_FRAMES)
+    database_thread.g_thread_profiler.start()
+    g_profiler = cProfile.Profile()
+    g_profiler.enable()
+
+
+def stop_profiling():
+    # Returns the names of the files that were written
+    global g_profiler
+
+    g_profiler.disable()
+    main_profile = g_profiler
+    g_profiler = None
+    thread_profile = database_thread.g_thread_profiler.stop(THREAD_STOP_TIMEOUT)
+    snapshot = tracemalloc.take_snapshot()
+    if g_started_tracemalloc:
+        tracemalloc.stop()
+
+    stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(g_start_time))
+    base = os.path.join(config.PARTS_DB_PATH, f'profile_{stamp}')
+    files = []
+
+    main_profile.dump_stats(base + '_main.pstats')
+    files.append(base + '_main.pstats')
+    if thread_profile:
+        thread_profile.dump_stats(base + '_database_thread.pstats')
+        files.append(base + '_database_thread.pstats')
+    elif database_thread.ThreadProfiler.SEES_ALL_THREADS:
+        futil.log(f'{CMD_NAME} -- The main profile includes the DatabaseThread...')
+    else:
+        futil.log(f'{CMD_NAME} -- No profile from the DatabaseThread...')
+
+    write_allocation_report(base + '_allocations.txt', snapshot, time.time() - g_start_time)
+    files.append(base + '_allocations.txt')
+
+    futil.log(f'{CMD_NAME} -- Wrote {", ".join(files)}...')
+    return files
+
+
+def write_allocation_report(filename: str, snapshot: tracemalloc.Snapshot, seconds: float):
+    # The memory still allocated at the end of the session by the lines
+    # that allocated it, and the full stacks of the biggest allocations
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ))
+    top = config.PROFILE_TOP_ALLOCATIONS
+    by_line = snapshot.statistics('lineno')
+    total = sum(stat.size for stat in by_line)
+
+    with open(filename, 'w') as f:
+        f.write(f'{CMD_NAME}: {seconds:.1f} s session, {total / 1024:.1f} KiB '
+                f'in {sum(stat.count for stat in by_line)} blocks still allocated\n\n')
+
+        f.write(f'Top {top} lines\n')
+        for i, stat in enumerate(by_line[:top], 1):
+            frame = stat.traceback[0]
+            f.write(f'{i:4} {stat.size / 1024:10.1f} KiB {stat.count:8} blocks  '
+                    f'{frame.filename}:{frame.lineno}\n')
+
+        f.write('\nTop 10 stacks\n')
+        for i, stat in enumerate(snapshot.statistics('traceback')[:10], 1):
+            f.write(f'\n{i:4} {stat.size / 1024:10.1f} KiB {stat.count:8} blocks\n')
+            for line in stat.traceback.format():
+                f.write(f'        {line}\n')
@@ -17,6 +17,72 @@ PARTS_DB_PATH = os.path.join(PARTS_DB_FOLDER, 'FRC-COTS_db')
 # Do we default to linking inserted parts?
 DEFAULT_TO_LINKED_PARTS = False
 
+# Thumbnail downloads
+# Maximum number of thumbnails being fetched from the cloud at the same time
+THUMBNAIL_MAX_IN_FLIGHT = 8
+# Seconds to wait for one thumbnail before trying again
+THUMBNAIL_JOB_TIMEOUT = 15.0
+# Number of retries for a thumbnail and the delay before the first retry
+# in seconds (the delay doubles for every retry after that)
+THUMBNAIL_MAX_RETRIES = 3
+THUMBNAIL_RETRY_DELAY = 2.0
+# Seconds before a thumbnail that could not be fetched is requested again
+THUMBNAIL_FAILURE_CACHE_TIME = 3600.0
+# Seconds between checks of the thumbnails being downloaded
+THUMBNAIL_POLL_INTERVAL = 0.05
+
+# Number of threads listing the folders of the parts project at the same
+# time while the index is built.  1 lists the folders on the database
+# thread itself.  It falls back to 1 if Fusion rejects listing from
+# several threads.
+FOLDER_LISTING_WORKERS = 1
+# Number of folder listings per worker that can be requested or waiting
+# for the crawl at a time.  More folders are listed as the crawl uses them.
+FOLDER_PREFETCH_PER_WORKER = 4
+
+# Maximum number of times a second the database thread sends events
+# (status, update and set_busy) to Fusion's main thread.  Events in
+# between are merged.
+MAX_MAIN_THREAD_EVENT_RATE = 10.0
+
+# Size in bytes the parts database's write-ahead log can grow to before
+# it is merged into the database file in the background
+PARTS_DB_JOURNAL_LIMIT = 4 * 1024 * 1024
+
+# Seconds a folder path that could not be found is remembered as missing
+FOLDER_NEGATIVE_CACHE_TIME = 300.0
+
+# Number of DataFiles looked up for inserting parts that are kept
+DATA_FILE_CACHE_SIZE = 256
+
+# Total size of the thumbnail icons kept on disk.  The least
+# recently used icons are removed when it is exceeded.
+ICON_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Seconds before a folder of the parts index is checked against the
+# cloud again.  Stale folders are revalidated in the background when
+# Fusion starts while the existing index is shown in the palette.
+REVALIDATE_INTERVAL = 24 * 3600.0
+
+# Record spans of the database thread, the palette and the insert commands
+# and write them to trace.json in PARTS_DB_PATH in the Chrome trace event
+# format (open it in chrome://tracing or https://ui.perfetto.dev).  Only
+# the last TRACE_MAX_EVENTS spans are kept.
+TRACE_ENABLED = False
+TRACE_MAX_EVENTS = 200000
+
+# Profiling command (started from the palette's stats view).  Number of
+# stack frames kept for each memory allocation and number of lines in the
+# top allocations report.
+PROFILE_TRACEMALLOC_FRAMES = 10
+PROFILE_TOP_ALLOCATIONS = 50
+
+# Write the folder listings and thumbnail results of the crawl, with their
+# timings, to a cloud_trace_<time>.jsonl file in PARTS_DB_PATH.  The names
+# and ids in the trace are made up so it can be shared and replayed with
+# benchmarks/replay_crawl.py.
+RECORD_CLOUD_TRACE = False
+
 
 # # Gets the name of the add-in from the name of the folder the py file is in.
 # # This is used when defining unique internal names for various UI elements 
@@ -28,6 +94,7 @@ COMPANY_NAME = 'TEAM_5000'
 # Command IDS
 INSERT_PART_CMD_ID = f'{COMPANY_NAME}_{ADDIN_NAME}_insertPart'
 INSERT_SPACER_CMD_ID = f'{COMPANY_NAME}_{ADDIN_NAME}_insertSpacer'
+PROFILE_CMD_ID = f'{COMPANY_NAME}_{ADDIN_NAME}_profileSession'
 
 # # Palettes
 palette_id = f'{COMPANY_NAME}_{ADDIN_NAME}_palette_id'
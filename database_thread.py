@@ -1,71 +1,239 @@
 import adsk.core
 import os
+import sys
 import threading
 import time
 import json
-import re
-from datetime import datetime, timedelta
-from queue import Queue
-from enum import Enum
+import bisect
+import sqlite3
+from datetime import datetime
+from collections import deque, OrderedDict
+from enum import Enum, IntEnum
+import heapq
+import cProfile
+from concurrent.futures import ThreadPoolExecutor, CancelledError
 
 from .lib import fusionAddInUtils as futil
 from . import config
+from .parts_store import PartsStore, PartEntry
+from .thumbnails import ThumbnailScheduler
+from .icon_store import IconStore, get_icon_filename
+from .metrics import g_metrics
+from .tracer import g_tracer, traced
+from .cloud_trace import start_recording
 
 app = adsk.core.Application.get()
 ui = app.userInterface
 
 myCustomEvent = 'FRC_COTS_DatabaseThreadEvent'
 
+class MainThreadEventBus:
+    # Outbound events from the DatabaseThread to the main thread.  Events
+    # posted while the last dispatch is less than 1 / MAX_MAIN_THREAD_EVENT_RATE
+    # seconds old wait and are merged with later events of the same action:
+    # only the latest 'status' and 'set_busy' are sent and any number of
+    # 'update's become one.  The DatabaseThread calls flush() to send the
+    # waiting events once the interval has passed.
+    def __init__(self):
+        rate = config.MAX_MAIN_THREAD_EVENT_RATE
+        self.min_interval = 1.0 / rate if rate > 0 else 0.0
+        self.mutex = threading.Lock()
+        self.pending = {}           # action -> data in the order first posted
+        self.last_dispatch = 0.0
+        self.posted = 0
+        self.dispatched = 0
+
+    def post(self, action, data):
+        self.mutex.acquire()
+        self.pending[action] = data
+        self.posted += 1
+        self.mutex.release()
+        g_metrics.inc('main_thread_events.posted')
+        self.flush()
+
+    def wait_time(self):
+        # Seconds until the waiting events can be sent or None if there are none
+        self.mutex.acquire()
+        try:
+            if not self.pending:
+                return None
+            return max(0.0, self.last_dispatch + self.min_interval - time.time())
+        finally:
+            self.mutex.release()
+
+    def flush(self, force: bool = False):
+        self.mutex.acquire()
+        now = time.time()
+        if not self.pending or (not force and now - self.last_dispatch < self.min_interval):
+            self.mutex.release()
+            return
+        events = self.pending
+        self.pending = {}
+        self.last_dispatch = now
+        self.dispatched += len(events)
+        self.mutex.release()
+        g_metrics.inc('main_thread_events.dispatched', len(events))
+
+        for action, data in events.items():
+            args = {'action': action, 'data': data}
+            app.fireCustomEvent( myCustomEvent, json.dumps(args) )
+
+class ThreadProfiler:
+    # Runs cProfile on the DatabaseThread while the profiling command asks
+    # for it.  Before Python 3.12 a profiler only sees the thread it was
+    # enabled on so the main thread leaves a request that the DatabaseThread
+    # picks up the next time around its loop (poll()).  From 3.12 on one
+    # profiler sees every thread and a second one can't be enabled, so the
+    # profile of the main thread already covers the DatabaseThread.
+    SEES_ALL_THREADS = sys.version_info >= (3, 12)
+
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.request = None         # True to start, False to stop
+        self.profiler = None        # cProfile.Profile while profiling
+        self.result = None          # cProfile.Profile of the last session
+        self.stopped = threading.Event()
+
+    def start(self):
+        if self.SEES_ALL_THREADS:
+            return
+        self.mutex.acquire()
+        try:
+            self.request = True
+            self.result = None
+            self.stopped.clear()
+        finally:
+            self.mutex.release()
+        if g_update_queue:
+            g_update_queue.wake()
+
+    def stop(self, timeout: float):
+        # Returns the profile of the DatabaseThread or None
+        self.mutex.acquire()
+        try:
+            if not self.profiler:
+                # The thread never started profiling (e.g. it isn't running)
+                self.request = None
+                return self.result
+            self.request = False
+        finally:
+            self.mutex.release()
+        if g_update_queue:
+            g_update_queue.wake()
+        self.stopped.wait(timeout)
+        return self.result
+
+    def poll(self):
+        # Called on the DatabaseThread
+        if self.request is None:
+            return
+        self.mutex.acquire()
+        try:
+            if self.request and not self.profiler:
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                    self.profiler = profiler
+                except ValueError:
+                    # Another profiler is already active on this thread
+                    futil.log('ThreadProfiler::poll() -- Profiling the DatabaseThread is unavailable...')
+            elif not self.request and self.profiler:
+                self.finish()
+        finally:
+            self.request = None
+            self.mutex.release()
+
+    def finish(self):
+        # Must be called with the mutex held on the DatabaseThread
+        if self.profiler:
+            self.profiler.disable()
+            self.result = self.profiler
+            self.profiler = None
+            self.stopped.set()
+
+    def thread_exiting(self):
+        self.mutex.acquire()
+        try:
+            self.finish()
+        finally:
+            self.request = None
+            self.mutex.release()
+
 # Global state
 g_parts_db = None        # PartsDatabase object
 g_parts_db_io = None     # PartsDatabaseFileIO object
 g_update_queue = None    # Folder Update queue
-
-def sanitize_part_name( part_name:str ):
-    safeName = re.sub(r'\W+', '', part_name)
-    return safeName
-
-def flatten_path( path:str ):
-    flat_path = path.replace( '\\', '_' )
-    flat_path = flat_path.replace( '/', '_' )
-    return flat_path
-
-def get_icon_filename( path:str, basename:str ):
-    """Path to the favorites JSON file next to this add-in."""
-    safeName = sanitize_part_name( basename )
-    flat_path = flatten_path(path)
-    folder = config.PARTS_DB_PATH
-    return os.path.join(folder, 'icons', f'{flat_path}{safeName}.png')
-
-def delete_all_icons():
-    icon_path = os.path.join(config.PARTS_DB_PATH, 'icons')
-    for f in os.listdir(icon_path):
-        try:
-            os.remove(os.path.join(icon_path,f))
-        except:
-            pass
+g_event_bus = MainThreadEventBus()
+g_thread_profiler = ThreadProfiler()
 
 def send_event_to_main_thread(action, data):
     # action is one of:
     #   'set_busy' -> set the palette busy state, data is e.g. {'isBusy': True, 'msg': 'Banner message'}
     #   'update' -> tell the palette to update, data is ''
     #   'status' -> set the status line, data is {'msg': 'Idle'}
-    args = {'action': action, 'data': data}
-    app.fireCustomEvent( myCustomEvent, json.dumps(args) )
+    g_event_bus.post(action, data)
+
+def earliest(*timeouts):
+    # The shortest of the timeouts that aren't None
+    waits = [t for t in timeouts if t is not None]
+    if not waits:
+        return None
+    return min(waits)
+
+# The DataFolder of a FolderRecord whose folder could not be found
+MISSING_FOLDER = object()
 
 class FolderRecord:
-    def __init__(self, name, dfolder: adsk.core.DataFolder, parent: 'FolderRecord'):
+    __slots__ = ('_childFolders', 'parentFolder', '_files', 'name', 'path', '_dataFolder',
+                 'folder_id', 'areChildrenUpdated', 'areFilesUpdated', 'listing')
+
+    def __init__(self, name, dfolder: adsk.core.DataFolder, parent: 'FolderRecord', folder_id: str = None):
+        # A record made from a folder id saved in the parts database has no
+        # DataFolder until its contents are needed.
         self._childFolders = {}  # [name] -> FolderRecord
         self.parentFolder = parent
         self._files = {}  # [id] -> FileRecord
         self.name = name
         if parent:
-            self.path = parent.path + name + '/'
+            self.path = sys.intern(parent.path + name + '/')
         else:
             self.path = '/'
-        self.dataFolder = dfolder
+        self._dataFolder = dfolder
+        self.folder_id = dfolder.id if dfolder else folder_id
         self.areChildrenUpdated = False
         self.areFilesUpdated = False
+        self.listing = None      # Future of the folder's (dataFolders, dataFiles) from the FolderListingPool
+
+    @property
+    def dataFolder(self) -> adsk.core.DataFolder:
+        if self._dataFolder is None:
+            dfolder = self.resolve_folder()
+            if dfolder:
+                self._dataFolder = dfolder
+                self.folder_id = dfolder.id
+            else:
+                # Only looked for once
+                self._dataFolder = MISSING_FOLDER
+                if g_parts_db_io:
+                    g_parts_db_io.folder_missing(self.path)
+        if self._dataFolder is MISSING_FOLDER:
+            return None
+        return self._dataFolder
+
+    def resolve_folder(self) -> adsk.core.DataFolder:
+        # The saved id still resolves if the folder was renamed or moved so
+        # it is only trusted if the folder has this name and parent.
+        # Otherwise the folder is looked up by name in the parent.
+        parent = self.parentFolder
+        if self.folder_id:
+            dfolder = app.data.findFolderById(self.folder_id)
+            if dfolder and dfolder.name == self.name and parent:
+                dparent = dfolder.parentFolder
+                if dparent and dparent.id == parent.folder_id:
+                    return dfolder
+        if parent and parent.dataFolder:
+            return parent.dataFolder.dataFolders.itemByName(self.name)
+        return None
 
     def add_child(self, new_child: 'FolderRecord'):
         if new_child.name in self._childFolders:
@@ -94,6 +262,8 @@ class FolderRecord:
         return None
 
 class FileRecord:
+    __slots__ = ('parentFolder', 'id', 'dataFile')
+
     def __init__(self, df: adsk.core.DataFile, parent: FolderRecord):
         self.parentFolder = parent
         self.id = df.id
@@ -105,14 +275,25 @@ class FolderJobPhase(Enum):
     SYNC_WITH_DATABASE = 3
     DONE = 4
 
+class FolderJobPriority(IntEnum):
+    VIEWED = 0          # The folder the user is looking at
+    VISIBLE = 1         # Subfolders of the folder the user is looking at
+    BACKGROUND = 2      # The crawl of the whole project
+
 class FolderUpdateJob:
+    # How much of the folder a job looks at.  When two jobs are queued
+    # for the same folder the one with the larger scope is kept.
+    SCOPE = 2
+
     def __init__(self, rec: FolderRecord):
         self.record = rec
+        self.path = rec.path
         self.phase = FolderJobPhase.PROCESS_FOLDERS
 
     def run_step(self):
         # Returns True if there is more to be done.
         global g_parts_db
+        global g_parts_db_io
         global g_update_queue
 
         # futil.log(f'Running step {self.phase} on folder {self.record.path}')
@@ -121,7 +302,9 @@ class FolderUpdateJob:
             case FolderJobPhase.PROCESS_FOLDERS:
                 g_parts_db.reload_record_subfolders(self.record)
                 for fdr in self.record._childFolders:
-                    g_update_queue.push(FolderUpdateJob(self.record.get_child(fdr)))
+                    child: FolderRecord = self.record.get_child(fdr)
+                    if g_update_queue.push(FolderUpdateJob(child)):
+                        g_parts_db_io.prefetch_listing(child)
                 self.phase = FolderJobPhase.PROCESS_FILES
             case FolderJobPhase.PROCESS_FILES:
                 g_parts_db.update_record_parts(self.record)
@@ -136,6 +319,7 @@ class FolderUpdateJob:
         return self.phase == FolderJobPhase.DONE
 
 class FolderViewedJob(FolderUpdateJob):
+    SCOPE = 0
 
     def run_step(self):
         # Returns True if there is more to be done.
@@ -156,48 +340,361 @@ class FolderViewedJob(FolderUpdateJob):
             case FolderJobPhase.DONE:
                 pass
 
+class FolderRevalidateJob(FolderUpdateJob):
+    # Checks one folder of a built database against the cloud while the
+    # existing index keeps serving the palette.  The folder record is only
+    # looked up when the job runs and the job is skipped if the folder was
+    # validated (e.g. viewed in the palette) after the job was queued.
+    SCOPE = 1
+
+    def __init__(self, path: str):
+        self.record = None
+        self.path = path
+        self.queued_time = time.time()
+        self.phase = FolderJobPhase.PROCESS_FOLDERS
+
+    def run_step(self):
+        global g_parts_db
+        global g_parts_db_io
+        global g_update_queue
+
+        match self.phase:
+            case FolderJobPhase.PROCESS_FOLDERS:
+                if g_parts_db.is_folder_validated_since(self.path, self.queued_time):
+                    self.phase = FolderJobPhase.DONE
+                    return
+                self.record = g_parts_db_io.get_data_folder(self.path)
+                if not self.record:
+                    # The parent folder's revalidation removes it from the database
+                    self.phase = FolderJobPhase.DONE
+                    return
+                g_parts_db.reload_record_subfolders(self.record)
+                self.phase = FolderJobPhase.PROCESS_FILES
+            case FolderJobPhase.PROCESS_FILES:
+                g_parts_db.update_record_parts(self.record)
+                self.phase = FolderJobPhase.SYNC_WITH_DATABASE
+            case FolderJobPhase.SYNC_WITH_DATABASE:
+                g_parts_db.sync_record_with_database(self.record)
+                # New folders have never been validated
+                for fdr in self.record._childFolders:
+                    child: FolderRecord = self.record.get_child(fdr)
+                    if g_parts_db.is_folder_stale(child.path):
+                        if g_update_queue.push(FolderRevalidateJob(child.path)):
+                            g_parts_db_io.prefetch_listing(child)
+                self.phase = FolderJobPhase.DONE
+            case FolderJobPhase.DONE:
+                pass
+
 class FolderUpdateQueue:
+    # Work queue of the DatabaseThread.  The thread waits on the condition
+    # until a job is pushed or wake() is called (a thumbnail was requested
+    # or the thread is stopping) so it uses no CPU when there is nothing
+    # to do.
+    #
+    # Jobs are popped in FolderJobPriority order and first in, first out
+    # within a priority.  There is only one queued job per folder path: a
+    # second push for the folder raises the priority of the queued job
+    # (and keeps the job with the larger scope).  The heap can hold stale
+    # entries for promoted or replaced jobs which pop() skips.  The folder
+    # listing prefetched for a replaced job's record is released.
     def __init__(self, job: FolderUpdateJob):
-        self.queue = Queue()
-        self.push(job)
+        self.heap = []          # (priority, count, job)
+        self.jobs = {}          # path -> queued job
+        self.count = 0
+        self.condition = threading.Condition()
+        self.woken = False
+        self.push(job, FolderJobPriority.VIEWED)
 
     def empty(self) -> bool:
-        return self.queue.empty()
+        with self.condition:
+            return len(self.jobs) == 0
     
-    def push(self, job: FolderUpdateJob):
-        self.queue.put(job)
+    def push(self, job: FolderUpdateJob, priority: FolderJobPriority = FolderJobPriority.BACKGROUND) -> bool:
+        # Returns True if job was queued and False if the job already
+        # queued for the folder was kept instead
+        replaced = None
+        with self.condition:
+            queued: FolderUpdateJob = self.jobs.get(job.path)
+            if queued:
+                if job.SCOPE > queued.SCOPE:
+                    job.priority = min(priority, queued.priority)
+                    replaced = queued
+                elif priority < queued.priority:
+                    job = queued
+                    job.priority = priority
+                else:
+                    return False
+            else:
+                job.priority = priority
+
+            self.jobs[job.path] = job
+            self.count += 1
+            heapq.heappush(self.heap, (job.priority, self.count, job))
+            self.woken = True
+            self.condition.notify()
+
+        if replaced and replaced.record and replaced.record is not job.record and g_parts_db_io:
+            g_parts_db_io.release_listing(replaced.record)
+        return job is not queued
+
+    def promote(self, path: str, priority: FolderJobPriority):
+        # Raise the priority of the job queued for the folder at path.
+        # Returns False if there is no job queued for the folder.
+        with self.condition:
+            job: FolderUpdateJob = self.jobs.get(path)
+            if not job:
+                return False
+            if priority < job.priority:
+                job.priority = priority
+                self.count += 1
+                heapq.heappush(self.heap, (priority, self.count, job))
+            return True
 
     def pop(self) -> FolderUpdateJob:
-        if self.queue.empty():
-            return None
-        job: FolderUpdateJob = self.queue.get()
-        futil.log(f'Queue::pop(size={self.queue.qsize()}) -- Working on {job.record.path}')
+        with self.condition:
+            while self.heap:
+                priority, _count, job = heapq.heappop(self.heap)
+                if self.jobs.get(job.path) is job and job.priority == priority:
+                    del self.jobs[job.path]
+                    break
+            else:
+                return None
+            size = len(self.jobs)
+        g_metrics.set('folder_queue.size', size)
+        futil.log(f'Queue::pop(size={size}) -- Working on {job.path} ({priority.name})')
         return job
 
+    def wake(self):
+        with self.condition:
+            self.woken = True
+            self.condition.notify()
+
+    def wait(self, timeout: float):
+        # Sleep until there is work or the timeout (None waits forever)
+        with self.condition:
+            if len(self.jobs) == 0 and not self.woken:
+                self.condition.wait(timeout)
+            self.woken = False
+
+def list_folder_contents(dataFolder: adsk.core.DataFolder, recorder = None):
+    # Returns the child folders and the f3d files of a folder
+    start = time.perf_counter()
+    with g_metrics.timer('cloud.list_folder'):
+        folders = [df for df in dataFolder.dataFolders]
+        files = [df for df in dataFolder.dataFiles
+                 if df.fileExtension and df.fileExtension.lower() == 'f3d']
+    if recorder:
+        recorder.listing(dataFolder, folders, files, time.perf_counter() - start)
+    return folders, files
+
+class FolderListingPool:
+    # Lists folders on worker threads ahead of the folder jobs that need
+    # them so the cloud round trips of several folders overlap.  The
+    # workers only read from the cloud; the DatabaseThread is still the
+    # only thread that changes the FolderRecords and the PartsDatabase.
+    # Folders are listed in the order they are queued which is the order
+    # the crawl gets to them.  At most FOLDER_PREFETCH_PER_WORKER listings
+    # per worker are outstanding (being listed or waiting for the crawl);
+    # the rest of the queued folders wait here until the crawl takes a
+    # listing.  If a listing fails on a worker the pool stops taking work
+    # and the folders are listed on the DatabaseThread as before.
+    def __init__(self, workers: int, recorder = None):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='FRC_COTS_Listing')
+        self.recorder = recorder    # CloudTraceRecorder or None
+        self.failed = False
+        self.mutex = threading.Lock()
+        self.limit = max(1, workers * config.FOLDER_PREFETCH_PER_WORKER)
+        self.waiting = deque()      # FolderRecords to list when there is room
+        self.outstanding = []       # FolderRecords with a listing not taken yet
+
+    def prefetch(self, fRec: FolderRecord):
+        if self.failed:
+            return
+
+        self.mutex.acquire()
+        try:
+            self.waiting.append(fRec)
+            self.submit_waiting()
+        finally:
+            self.mutex.release()
+
+    def listing_taken(self):
+        # The crawl used up a listing so there is room for another
+        if self.failed:
+            return
+
+        self.mutex.acquire()
+        try:
+            self.submit_waiting()
+        finally:
+            self.mutex.release()
+
+    def release(self, fRec: FolderRecord):
+        # The job the listing was for was dropped so nothing will take it
+        self.mutex.acquire()
+        try:
+            if fRec.listing:
+                fRec.listing.cancel()
+                fRec.listing = None
+            if not self.failed:
+                self.submit_waiting()
+        finally:
+            self.mutex.release()
+
+    def submit_waiting(self):
+        # Must be called with the mutex held
+        self.outstanding = [rec for rec in self.outstanding if rec.listing and not self.is_orphan(rec)]
+        while self.waiting and len(self.outstanding) < self.limit:
+            fRec = self.waiting.popleft()
+            if fRec.listing or self.is_orphan(fRec):
+                continue
+            dataFolder = fRec.dataFolder
+            if not dataFolder:
+                # Not found, nothing to list
+                continue
+            fRec.listing = self.executor.submit(self.list_folder, dataFolder)
+            self.outstanding.append(fRec)
+
+    def is_orphan(self, fRec: FolderRecord) -> bool:
+        # The parent was listed again and replaced the record so no job
+        # will take its listing
+        parent = fRec.parentFolder
+        if parent and parent.get_child(fRec.name) is not fRec:
+            if fRec.listing:
+                fRec.listing.cancel()
+                fRec.listing = None
+            return True
+        return False
+
+    def list_folder(self, dataFolder: adsk.core.DataFolder):
+        # Runs on a worker.  An error is left in the future for the thread
+        # taking the listing to report since Fusion only logs from there.
+        try:
+            return list_folder_contents(dataFolder, self.recorder)
+        except:
+            self.failed = True
+            raise
+
+    def shutdown(self):
+        self.mutex.acquire()
+        self.waiting.clear()
+        self.mutex.release()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
 class PartsDatabaseFileIO:
-    def __init__(self, project: adsk.core.DataProject):
+    def __init__(self, project: adsk.core.DataProject = None):
+        # The project can be set later with set_project() so the parts
+        # database can be loaded before the cloud project is found.
+        self.project = None
+        self.rootRec = None
+        self.record_mutex = threading.Lock()
+
+        # Trace of the listings and thumbnails for replaying the crawl offline
+        self.recorder = start_recording() if config.RECORD_CLOUD_TRACE else None
+
+        self.thumbnails = ThumbnailScheduler()
+        self.thumbnails.recorder = self.recorder
+
+        self.listing_pool = None
+        self.listing_failed = False     # A worker's listing failed and was reported
+        if config.FOLDER_LISTING_WORKERS > 1:
+            self.listing_pool = FolderListingPool(config.FOLDER_LISTING_WORKERS, self.recorder)
+
+        # Folder path -> folder id saved in the parts database so paths
+        # resolve without listing every folder on the way, and
+        # path -> time of the paths that were looked for and not found.
+        self.folder_ids = {}
+        self.missing_paths = {}
+
+        # LRU cache of the DataFiles found by id: id -> FileRecord
+        self.data_files = OrderedDict()
+
+        if project:
+            self.set_project(project)
+
+    def set_project(self, project: adsk.core.DataProject):
         self.project = project
         self.rootRec = FolderRecord( 'root', self.project.rootFolder, None )
-        self.record_mutex = threading.Lock()
-        self.thumbnail_jobs = Queue()
-        self.priority_thumbnail_jobs = Queue()
+        if self.recorder:
+            self.recorder.project(self.project.rootFolder)
+
+    def set_folder_ids(self, folder_ids: dict):
+        self.record_mutex.acquire()
+        self.folder_ids = folder_ids
+        self.missing_paths = {}
+        self.record_mutex.release()
+
+    def update_folder_id(self, path: str, folder_id: str) -> bool:
+        # Returns True if the saved id of the folder changed
+        self.record_mutex.acquire()
+        changed = self.folder_ids.get(path) != folder_id
+        self.folder_ids[path] = folder_id
+        self.missing_paths.pop(path, None)
+        self.record_mutex.release()
+        return changed
+
+    def folder_missing(self, path: str):
+        # Neither the saved id nor the name of the folder found it
+        self.record_mutex.acquire()
+        self.folder_ids.pop(path, None)
+        self.missing_paths[path] = time.time()
+        self.record_mutex.release()
+
+    def forget_folder_ids(self, paths: list):
+        self.record_mutex.acquire()
+        for path in paths:
+            self.folder_ids.pop(path, None)
+        self.record_mutex.release()
 
     def get_data_file(self, path, id):
         futil.log( f'get_data_file() -- Getting data file at {path} with id={id}...')
-        
-        fRec = self.get_data_folder(path)
-        if not fRec:
-            futil.log_error( f'Cannot find dataFolder {path}.')
-            return None
-        
-        fileRec = fRec.get_file(id)
+
+        self.record_mutex.acquire()
+        fileRec = self.data_files.get(id)
         if fileRec:
+            self.data_files.move_to_end(id)
+        self.record_mutex.release()
+        if fileRec:
+            g_metrics.inc('data_file_cache.hits')
             return fileRec
-        
-        self.load_folder_files(fRec, True)
-        return fRec.get_file(id)
+        g_metrics.inc('data_file_cache.misses')
+
+        # Ask for the one file first.  Resolving the folder can take a cloud
+        # round trip per path segment and listing it is the last resort.
+        with g_metrics.timer('cloud.find_file'):
+            df = app.data.findFileById(id)
+        if df:
+            fileRec = FileRecord(df, None)
+        else:
+            fRec = self.get_data_folder(path)
+            if not fRec:
+                futil.log_error( f'Cannot find dataFolder {path}.')
+                return None
+            fileRec = fRec.get_file(id)
+            if not fileRec:
+                self.load_folder_files(fRec)
+                fileRec = fRec.get_file(id)
+                if not fileRec:
+                    return None
+
+        self.record_mutex.acquire()
+        self.data_files[id] = fileRec
+        while len(self.data_files) > config.DATA_FILE_CACHE_SIZE:
+            self.data_files.popitem(last=False)
+        self.record_mutex.release()
+        return fileRec
+
+    def forget_data_file(self, id):
+        # The part changed so the cached DataFile may be an old version
+        self.record_mutex.acquire()
+        self.data_files.pop(id, None)
+        self.record_mutex.release()
 
     def get_data_folder(self, path: str) -> FolderRecord:
+        if not self.rootRec:
+            # The project hasn't been found yet
+            return None
+
         if path == '/':
             return self.rootRec
 
@@ -211,7 +708,9 @@ class PartsDatabaseFileIO:
         while len(path_parts) > 0:
             childRec = fRec.get_child(path_parts[0])
             if not childRec:
-                return self.find_folder_with_path( start_path, fRec, path_parts )
+                childRec = self.find_child_folder( start_path, fRec, path_parts[0] )
+                if not childRec:
+                    return None
             
             fRec = childRec
             start_path = start_path + path_parts[0] + '/'
@@ -219,139 +718,200 @@ class PartsDatabaseFileIO:
         
         return fRec
     
-    def find_folder_with_path( self, start_path: str, startRec: FolderRecord, path_parts: str ):
-        # Look for a folder that is a sub-folder of the startRec
-        # path_parts is a List of folders that we are looking for
-        # when that list has a length of 1 we have found the folder we
-        # are looking for.
-        dfolder = startRec.dataFolder.dataFolders.itemByName( path_parts[0] )
-        if not dfolder:
-            futil.log_error( f'find_folder_with_path() Error finding folder {start_path}{path_parts[0]}...')
-            return None
+    def find_child_folder( self, start_path: str, startRec: FolderRecord, name: str ):
+        # Make the record of the sub-folder 'name' of startRec.  The saved
+        # folder id is used if there is one, otherwise the folder is looked
+        # up in the cloud.
+        child_path = start_path + name + '/'
+        self.record_mutex.acquire()
+        folder_id = self.folder_ids.get(child_path)
+        missing_time = self.missing_paths.get(child_path)
+        self.record_mutex.release()
+
+        if folder_id:
+            # Check the saved id still names this folder so a deleted or
+            # renamed folder doesn't stay in the tree
+            fRec = FolderRecord( name, None, startRec, folder_id )
+            if not fRec.dataFolder:
+                futil.log_error( f'find_child_folder() Error finding folder {child_path}...')
+                return None
+        else:
+            if missing_time and time.time() - missing_time < config.FOLDER_NEGATIVE_CACHE_TIME:
+                return None
+
+            dfolder = startRec.dataFolder.dataFolders.itemByName( name ) if startRec.dataFolder else None
+            if not dfolder:
+                futil.log_error( f'find_child_folder() Error finding folder {child_path}...')
+                self.record_mutex.acquire()
+                self.missing_paths[child_path] = time.time()
+                self.record_mutex.release()
+                return None
+            fRec = FolderRecord( dfolder.name, dfolder, startRec )
 
-        dfolder_path = start_path + dfolder.name + '/'
-        fRec = FolderRecord( dfolder.name, dfolder, startRec )
         self.record_mutex.acquire()
         startRec.add_child(fRec)
+        fRec = startRec.get_child(name)
         self.record_mutex.release()
+        return fRec
 
-        # We are done.  Return the folder
-        if len(path_parts) == 1:
-            return fRec
-        
-        # Look inside the new folder since length of path_parts is greater than 1
-        return self.find_folder_with_path( dfolder_path, fRec, path_parts[1:] )
+    def prefetch_listing(self, fRec: FolderRecord):
+        if self.listing_pool:
+            self.listing_pool.prefetch(fRec)
+
+    def take_listing(self, fRec: FolderRecord, keep: bool):
+        # Returns the (dataFolders, dataFiles) listed by the pool or None
+        # if the folder has to be listed here.  The files are the last
+        # thing read from a listing so they don't keep it.
+        self.record_mutex.acquire()
+        future = fRec.listing
+        if not keep:
+            fRec.listing = None
+        self.record_mutex.release()
+        if not future:
+            return None
+
+        try:
+            listing = future.result()
+        except CancelledError:
+            return None
+        except:
+            if not self.listing_failed:
+                self.listing_failed = True
+                futil.handle_error('FolderListingPool -- Listing on a worker failed.  Using one worker...')
+            return None
+        if not keep:
+            self.listing_pool.listing_taken()
+        return listing
+
+    def release_listing(self, fRec: FolderRecord):
+        if self.listing_pool:
+            self.listing_pool.release(fRec)
+
+    def get_data_folders(self, fRec: FolderRecord):
+        listing = self.take_listing(fRec, True)
+        if listing:
+            return listing[0]
+        dataFolder = fRec.dataFolder
+        if not dataFolder:
+            return []
+        start = time.perf_counter()
+        with g_metrics.timer('cloud.list_subfolders'):
+            folders = [df for df in dataFolder.dataFolders]
+        if self.recorder:
+            self.recorder.listing(dataFolder, folders, None, time.perf_counter() - start)
+        return folders
 
     def reload_folder_children(self, fRec: FolderRecord):
         fRec.areChildrenUpdated = True
         fRec._childFolders = {}
-        for df in fRec.dataFolder.dataFolders:
+        for df in self.get_data_folders(fRec):
             self.record_mutex.acquire()
             fRec.add_child(FolderRecord(df.name, df, fRec))
             self.record_mutex.release()
 
     def update_folder_children(self, fRec: FolderRecord):
         fRec.areChildrenUpdated = True
-        for df in fRec.dataFolder.dataFolders:
+        for df in self.get_data_folders(fRec):
             self.record_mutex.acquire()
             fRec.add_child(FolderRecord(df.name, df, fRec))
             self.record_mutex.release()
 
-    def load_folder_files(self, fRec: FolderRecord, ui_priority: bool):
+    def load_folder_files(self, fRec: FolderRecord):
         fRec.areFilesUpdated = True
         fRec._files = {}
-        for df in fRec.dataFolder.dataFiles:
-            if df.fileExtension and df.fileExtension.lower() == 'f3d':
-                self.record_mutex.acquire()
-                fRec.add_file(FileRecord(df, fRec))
-                self.record_mutex.release()
-                self.add_thumbnail_job(fRec.path, df, ui_priority)
-
-    def add_thumbnail_job(self, path, dataFile: adsk.core.DataFile, ui_priority: bool):
-        icon_name = get_icon_filename(path, dataFile.name)
-        if ui_priority:
-            self.priority_thumbnail_jobs.put((icon_name, dataFile.thumbnail))
+        listing = self.take_listing(fRec, False)
+        dataFolder = fRec.dataFolder if not listing else None
+        if listing:
+            files = listing[1]
+        elif dataFolder:
+            start = time.perf_counter()
+            with g_metrics.timer('cloud.list_files'):
+                files = [df for df in dataFolder.dataFiles
+                         if df.fileExtension and df.fileExtension.lower() == 'f3d']
+            if self.recorder:
+                self.recorder.listing(dataFolder, None, files, time.perf_counter() - start)
         else:
-            self.thumbnail_jobs.put((icon_name, dataFile.thumbnail))
-
-    def is_thumbnail_job_waiting(self):
-        return not self.thumbnail_jobs.empty()
-
-    def process_one_thumbnail_job(self, queue: Queue):
-        # Process a single job from the queue and return
-        # True if an icon file was saved.
-        job = queue.get()
-        icon_name = job[0]
-        thumb_future: adsk.core.DataObjectFuture = job[1]
-        # futil.log(f'Processing thumbnail {icon_name} ...')
-
-        if thumb_future.state == adsk.core.FutureStates.FinishedFutureState:
-            try:
-                if thumb_future.dataObject != None:
-                    # futil.log(f'Creating thumbnail for {icon_name}')
-                    try:
-                        os.remove( icon_name )
-                    except:
-                        pass
-                    thumb_future.dataObject.saveToFile( icon_name )
-                    return True
-            except:
-                futil.handle_error(f'   Error processing thumbnail {icon_name}...')
-        elif thumb_future.state == adsk.core.FutureStates.ProcessingFutureState:
-            # Not done.  Put it and the end of the line
-            queue.put( job )
-            time.sleep(0.05)
-        else:
-            futil.log(f'   Retrieving thumbnail for {icon_name} failed...')
-
-        return False
+            files = []
+        for df in files:
+            self.record_mutex.acquire()
+            fRec.add_file(FileRecord(df, fRec))
+            self.record_mutex.release()
 
-    def process_thumbnail_jobs(self, maxNumber: int = -1):
-        # Process at most maxNumber of thumbnail jobs
-        # If maxNumber = -1 process all available jobs
-        # Returns True if some thumbnails were saved
-        if self.thumbnail_jobs.empty() and self.priority_thumbnail_jobs.empty():
-            # No more jobs to process
-            return False
+    def close(self):
+        if self.listing_pool:
+            self.listing_pool.shutdown()
+        if self.recorder:
+            self.recorder.close()
 
-        start_time = time.time()
-        TIMEOUT = 2.0
+    def add_thumbnail_job(self, dataFile: adsk.core.DataFile, ui_priority: bool):
+        # The thumbnail is only requested from the cloud when the
+        # scheduler has room for it.
+        global g_update_queue
 
-        need_update = False
-        # Process the priority thumbnails that were requested due to
-        # the UI navigation
-        while not self.priority_thumbnail_jobs.empty() and time.time() - start_time < TIMEOUT:
-            if self.process_one_thumbnail_job(self.priority_thumbnail_jobs):
-                # We processed a priority thumbnail and saved a file.
-                # Need to update the palette
-                need_update = True
+        icon_name = get_icon_filename(dataFile.id)
+        self.thumbnails.add_job(dataFile.id, dataFile.versionNumber, icon_name, dataFile, ui_priority)
+        if g_update_queue:
+            g_update_queue.wake()
 
-        if maxNumber == -1:
-            maxNumber = 200
-        
-        idx = 0
-        # Only allow 2 seconds for processing
-        while not self.thumbnail_jobs.empty() and idx < maxNumber and time.time() - start_time < TIMEOUT:
-            idx = idx + 1
-            self.process_one_thumbnail_job(self.thumbnail_jobs)
+    def thumbnail_wait_time(self):
+        # Seconds until the thumbnails need looking at or None if there are none
+        return self.thumbnails.wait_time()
 
-        if time.time() - start_time > TIMEOUT:
-            futil.log(f'   Processing thumbnails TIMED OUT!! ..')
+    def process_thumbnail_jobs(self):
+        # Start and poll thumbnail requests.
+        # Returns True if thumbnails requested by the UI were saved
+        return self.thumbnails.process()
 
-        return need_update
+    def pop_saved_thumbnails(self):
+        # Return (id, version, icon name) of the thumbnails saved since the last call
+        return self.thumbnails.pop_saved()
 
 
 class PartsDatabase:
     DATE_FORMAT = r'%d/%m/%y %H:%M:%S.%f'
-    EXPIRED_DATABASE = timedelta( 14 )  # Forteen days
     JSON_FILE = 'parts_db.json'
+    SQLITE_FILE = 'parts_db.sqlite'
+    CHANGE_LOG_SIZE = 10000     # Number of part changes kept for the palette
 
     def __init__(self, io: PartsDatabaseFileIO):
         self.io = io
         self.mutex = threading.Lock()
         self.database = {}
-
-        if not self.load_json_file():
+        self.store = None
+        self.saved_meta = None      # Build state last written to the store
+
+        # Change feed for the palette.  Every added, changed or removed
+        # part id gets the next sequence number.  The epoch changes each
+        # time the database is loaded so the palette can tell when its
+        # sequence numbers belong to an older database.
+        self.epoch = f'{time.time():.6f}'
+        self.sequence = 0
+        self.changes = deque(maxlen=PartsDatabase.CHANGE_LOG_SIZE)  # (sequence, kind, id)
+
+        # The parts as (path, name, id) tuples kept in sorted order
+        # by add_part() and remove_part().  Finding the place is a binary
+        # search but inserting or deleting there still moves the rest of
+        # the list, so a change is O(n) (a memmove, a few microseconds
+        # at 10k parts) instead of a full sort.  Readers get sorted_view,
+        # an immutable copy made on the first read after a change.  Only
+        # a full palette reload reads it; otherwise the palette gets deltas.
+        self.sorted_parts = []
+        self.sorted_view = ()
+
+        # Icons on disk and the manifest of their part versions
+        self.icons = None
+
+        # Folder tree index.  database['paths'] maps every known folder
+        # path to the set of part ids directly in it and folder_children
+        # maps a folder path to the paths of its child folders.  Empty
+        # folders are nodes in the tree like any other folder.
+        self.folder_children = {}
+
+        # Folder path -> time the folder was last checked against the cloud.
+        # Stale folders are revalidated in the background.
+        self.folder_validated = {}
+
+        if not self.load_database_file():
             self.blank_database()
             return
         
@@ -371,27 +931,55 @@ class PartsDatabase:
         if not 'build_date' in self.database:
             self.database['build_date'] = datetime.strftime(datetime(1900, 1, 1), PartsDatabase.DATE_FORMAT)
 
-        # Check if the database is too old.
-        build_date = datetime.strptime(self.database['build_date'], PartsDatabase.DATE_FORMAT)
-        if datetime.now() - build_date > PartsDatabase.EXPIRED_DATABASE:
-            futil.log(f'Expired database..  Build date = {build_date}')
-            delete_all_icons()
+        # The cloud project may not have been found yet so check the
+        # name in the settings.  The id is checked by set_project().
+        if self.database['project']['name'] != config.PARTS_DB_PROJECT:
+            # The parts db is for a different project!
+            futil.log(f'Database project and the settings project do not match!')
+            futil.log(f'   Regenerating the parts database...')
             self.blank_database()
-            return
 
-        if self.database['project']['name'] != self.io.project.name:
-            # The parts db is for a different project!
-            futil.log(f'JSON project and the settings project do not match!')
-            futil.log(f'   Regenerating the JSON database...')
+    def set_project(self, project: adsk.core.DataProject):
+        # The cloud project was found.  The index is thrown away if it
+        # was built from a different project with the same name.
+        self.io.set_project(project)
+        db_project = self.database['project']
+        if db_project.get('id') and db_project['id'] != project.id:
+            futil.log(f'Database project id {db_project["id"]} does not match {project.id}!')
+            futil.log(f'   Regenerating the parts database...')
             self.blank_database()
+        self.database['project'] = {'name': project.name, 'id': project.id}
 
     def blank_database(self):
         self.database = {}
         self.database['built'] = False
         self.database['build_date'] = datetime.strftime(datetime(1900, 1, 1), PartsDatabase.DATE_FORMAT)
-        self.database['project'] = {'name': self.io.project.name, 'id': self.io.project.id }
+        if self.io.project:
+            self.database['project'] = {'name': self.io.project.name, 'id': self.io.project.id }
+        else:
+            self.database['project'] = {'name': config.PARTS_DB_PROJECT, 'id': '' }
         self.database['parts'] = {}
-        self.database['paths'] = {}
+        self.database['paths'] = {'/': set()}
+        self.folder_children = {'/': set()}
+        self.folder_validated = {}
+
+        # Anything the palette has is no longer valid
+        self.epoch = f'{time.time():.6f}'
+        self.sequence = 0
+        self.changes.clear()
+        self.sorted_parts = []
+        self.sorted_view = ()
+
+        if self.icons:
+            self.icons.forget()
+        self.io.set_folder_ids({})
+
+        if self.store:
+            try:
+                self.store.clear()
+                self.store.set_meta(self.get_meta())
+            except sqlite3.Error:
+                futil.handle_error('blank_database() -- Could not clear the parts database file.')
 
     def is_built(self):
         return self.database['built']
@@ -401,71 +989,241 @@ class PartsDatabase:
         self.database['build_date'] = timestr
         self.database['built'] = True
 
-    def add_part(self, id, path, name, version):
-        
-        icon_name = get_icon_filename(path, name)
+    def add_part(self, id, path, name, version, modified = None):
+
         if path[-1] != '/':
             path = path + '/'
+        part = PartEntry(path, name, version, modified)
+        path = part.path
         self.mutex.acquire()
-        if not path in self.database['paths']:
-            self.database['paths'][path] = []
-        if not id in self.database['paths'][path]:
-            self.database['paths'][path].append(id)
-        self.database['parts'][id] = { "path": path,
-                                       "name": name,
-                                       "version": version, 
-                                       "icon": icon_name }
+        new_folders = self.insert_folder(path)
+        old_part: PartEntry = self.database['parts'].get(id)
+        changed = old_part != part
+        if changed:
+            self.database['parts'][id] = part
+            self.database['paths'][path].add(id)
+        if not old_part:
+            self.sorted_insert(id, part)
+            self.record_change('added', id)
+        elif changed:
+            self.io.forget_data_file(id)
+            if old_part.path != path:
+                # The part was moved to a different folder
+                self.database['paths'][old_part.path].discard(id)
+            self.sorted_remove(id, old_part)
+            self.sorted_insert(id, part)
+            # A new modification time alone doesn't change anything the palette shows
+            if old_part.path != path or old_part.name != name or old_part.version != version:
+                self.record_change('changed', id)
         self.mutex.release()
 
+        # Parts that haven't changed since the last listing are not written
+        with self.store.transaction():
+            for folder in new_folders:
+                self.write_store(self.store.add_folder, folder)
+            if changed:
+                self.write_store(self.store.upsert_part, id, path, name, version, modified)
+
     def remove_part(self, id):
         try:
             self.mutex.acquire()
-            part = self.database['parts'][id]
-            path = part['path']
-            self.database['paths'][path].remove(id)
-            if len(self.database['paths'][path]) == 0:
-                del self.database['paths'][path]
-
-            del self.database['parts'][id]
-
+            self.delete_part(id)
         except:
             futil.handle_error(f'remove_part() id = {id}')
+            return
         finally:
             self.mutex.release()
 
+        self.write_store(self.store.delete_parts, [id])
+
     def remove_part_at_path(self, id, path):
-        # If a part gets moved from one folder to another
-        # then the partID is still in the database but
-        # the path should be different
-        try:
-            self.mutex.acquire()
-            part = self.database['parts'][id]
-            id_path = part['path']
-            self.database['paths'][path].remove(id)
-            if len(self.database['paths'][path]) == 0:
-                del self.database['paths'][path]
+        # Remove the part only if it is still in the folder at path.
+        # If a part gets moved from one folder to another then the
+        # partID is still in the database but at a different path.
+        self.mutex.acquire()
+        part = self.database['parts'].get(id)
+        removed_part = part is not None and part.path == path
+        if removed_part:
+            self.delete_part(id)
+        self.mutex.release()
 
-            if id_path == path:
-                del self.database['parts'][id]
+        if removed_part:
+            self.write_store(self.store.delete_parts, [id])
 
-        except:
-            futil.handle_error(f'remove_part() id = {id}')
-        finally:
-            self.mutex.release()
+    def delete_part(self, id):
+        # Must be called with the mutex held
+        self.io.forget_data_file(id)
+        part = self.database['parts'].pop(id)
+        self.database['paths'][part.path].discard(id)
+        self.sorted_remove(id, part)
+        self.record_change('removed', id)
 
+    def add_folder(self, path):
+        self.mutex.acquire()
+        new_folders = self.insert_folder(path)
+        self.mutex.release()
 
+        with self.store.transaction():
+            for folder in new_folders:
+                self.write_store(self.store.add_folder, folder)
 
-    def add_folder_placeholder(self, path):
-        id = path + '_placeholder_'
-        self.add_part(id, path, '_placeholder_', '')
+    def remove_folder(self, path):
+        # Remove the folder, all the folders below it and their parts
+        self.mutex.acquire()
+        folders, ids = self.delete_folder(path)
+        self.mutex.release()
+        self.io.forget_folder_ids(folders)
+
+        with self.store.transaction():
+            self.write_store(self.store.delete_parts, ids)
+            self.write_store(self.store.delete_folders, folders)
+
+    def insert_folder(self, path):
+        # Must be called with the mutex held.  Adds the folder and any
+        # missing parent folders to the tree and returns the new paths.
+        if path in self.database['paths']:
+            return []
+
+        path = sys.intern(path)
+        parent = parent_path(path)
+        new_folders = self.insert_folder(parent)
+        self.database['paths'][path] = set()
+        self.folder_children[path] = set()
+        self.folder_children[parent].add(path)
+        self.record_change('folder_added', path)
+        new_folders.append(path)
+        return new_folders
+
+    def delete_folder(self, path):
+        # Must be called with the mutex held.  Returns the folder paths
+        # and part ids that were deleted.
+        if not path in self.database['paths'] or path == '/':
+            return [], []
+
+        folders = []
+        ids = []
+        stack = [path]
+        while stack:
+            folder = stack.pop()
+            stack.extend(self.folder_children.pop(folder))
+            for id in list(self.database['paths'][folder]):
+                if self.database['parts'][id].path == folder:
+                    self.delete_part(id)
+                    ids.append(id)
+            del self.database['paths'][folder]
+            self.folder_validated.pop(folder, None)
+            self.record_change('folder_removed', folder)
+            folders.append(folder)
+
+        self.folder_children[parent_path(path)].discard(path)
+        return folders, ids
+
+    def rebuild_folder_tree(self, folders):
+        # Must be called with the mutex held
+        self.database['paths'] = {'/': set()}
+        self.folder_children = {'/': set()}
+        for folder in folders:
+            self.insert_folder(folder)
+        for id, part in self.database['parts'].items():
+            self.insert_folder(part.path)
+            self.database['paths'][part.path].add(id)
+
+    def touch_part(self, id):
+        # Something about the part changed outside of the database
+        # (e.g. a new thumbnail) so the palette needs to reload it.
+        self.mutex.acquire()
+        if id in self.database['parts']:
+            self.record_change('changed', id)
+        self.mutex.release()
 
-    def remove_folder_placeholder(self, path):        
-        id = path + '_placeholder_'
-        if not id in self.database['parts']:
-            # This placeholder is not in the db
-            return
-        
-        self.remove_part(id)
+    def sorted_insert(self, id, part):
+        # Must be called with the mutex held
+        bisect.insort(self.sorted_parts, (part.path, part.name, id))
+        self.sorted_view = None
+
+    def sorted_remove(self, id, part):
+        # Must be called with the mutex held
+        entry = (part.path, part.name, id)
+        idx = bisect.bisect_left(self.sorted_parts, entry)
+        if idx < len(self.sorted_parts) and self.sorted_parts[idx] == entry:
+            del self.sorted_parts[idx]
+            self.sorted_view = None
+
+    def rebuild_sorted_parts(self):
+        # Must be called with the mutex held
+        self.sorted_parts = sorted((data.path, data.name, id)
+                                   for id, data in self.database['parts'].items())
+        self.sorted_view = None
+
+    def record_change(self, kind, id):
+        # Must be called with the mutex held
+        self.sequence += 1
+        self.changes.append((self.sequence, kind, id))
+
+    def get_changes_since(self, epoch, since):
+        # Returns the net changes after sequence number 'since' as
+        # {'epoch', 'since', 'seq', 'parts': [(path, name, id)], 'removed': [id],
+        #  'folders': [path], 'removedFolders': [path]}
+        # or None if the caller needs the full list because the epoch or
+        # sequence numbers don't line up with the change log.
+        self.mutex.acquire()
+        try:
+            if epoch != self.epoch or since < 0 or since > self.sequence:
+                return None
+            if since < self.sequence and since < self.changes[0][0] - 1:
+                # The change log no longer goes back that far
+                return None
+
+            # Walk back through the log to find the first change for
+            # each part id and folder path after 'since'
+            first_kind = {}
+            first_folder_kind = {}
+            for seq, kind, key in reversed(self.changes):
+                if seq <= since:
+                    break
+                if kind.startswith('folder_'):
+                    first_folder_kind[key] = kind
+                else:
+                    first_kind[key] = kind
+
+            parts = []
+            removed = []
+            for id, kind in first_kind.items():
+                data = self.database['parts'].get(id)
+                if data:
+                    parts.append((data.path, data.name, id))
+                elif kind != 'added':
+                    # Only tell the palette about parts it knows about
+                    removed.append(id)
+
+            folders = []
+            removed_folders = []
+            for path, kind in first_folder_kind.items():
+                if path in self.database['paths']:
+                    folders.append(path)
+                elif kind != 'folder_added':
+                    removed_folders.append(path)
+
+            return { 'epoch': self.epoch,
+                     'since': since,
+                     'seq': self.sequence,
+                     'parts': parts,
+                     'removed': removed,
+                     'folders': sorted(folders),
+                     'removedFolders': removed_folders }
+        finally:
+            self.mutex.release()
+
+    def get_sequence(self):
+        return self.epoch, self.sequence
+
+    def write_store(self, write_fn, *args):
+        # Write a change through to the SQLite store.  A failed
+        # write is logged but the in-memory database stays valid.
+        try:
+            write_fn(*args)
+        except sqlite3.Error:
+            futil.handle_error(f'Could not write to the parts database file ({write_fn.__name__}).')
 
     def get_part(self, id):
         try:
@@ -473,30 +1231,73 @@ class PartsDatabase:
             return part
         except:
             return None
+
+    def lookup_part(self, id):
+        # Returns (path, name, id) for the part or None
+        self.mutex.acquire()
+        data = self.database['parts'].get(id)
+        self.mutex.release()
+        if not data:
+            return None
+
+        return (data.path, data.name, id)
         
-    def get_sorted_list(self):
+    def get_child_folder_paths(self, path):
+        self.mutex.acquire()
+        children = list(self.folder_children.get(path, ()))
+        self.mutex.release()
+        return children
+
+    def get_part_count(self):
+        return len(self.database['parts'])
+
+    def get_folder_paths(self):
         self.mutex.acquire()
-        sorted_list = [(data['path'], data['name'], id, data['icon']) for id, data in self.database['parts'].items()]
+        folders = sorted(self.database['paths'])
         self.mutex.release()
+        return folders
 
-        sorted_list.sort()
+    def get_sorted_list(self):
+        # Returns an immutable, sorted tuple of (path, name, id)
+        # along with the change feed position it corresponds to.  The
+        # tuple is copied from sorted_parts (O(n)) the first time it is
+        # asked for after a change and shared until the next one.
+        self.mutex.acquire()
+        if self.sorted_view is None:
+            self.sorted_view = tuple(self.sorted_parts)
+        sorted_list = self.sorted_view
+        epoch, sequence = self.epoch, self.sequence
+        self.mutex.release()
 
-        return sorted_list
+        return sorted_list, epoch, sequence
 
     def update_folder(self, path):
         global g_update_queue
 
+        if not g_update_queue:
+            # Still starting up.  The folder is checked with the rest.
+            return False
+
         dfRec = self.io.get_data_folder(path)
         if not dfRec:
             futil.log_error( f'update_folder() -- Error loading "{path}".')
             return False
+
+        # The icons of this folder are being shown
+        self.touch_icons(path)
+
+        # The subfolders are shown in the palette too so any of their
+        # jobs waiting in the background crawl go ahead of the rest
+        for child_path in self.get_child_folder_paths(path):
+            g_update_queue.promote(child_path, FolderJobPriority.VISIBLE)
         
         # if self.is_built() or (g_update_queue.empty() and dfRec.areChildrenUpdated and dfRec.areFilesUpdated):
         if self.is_built():
             # Both the files and the folder have been updated
             # so add this folder to the job queue to check for
-            # any changes since running Fusion but turn recursion off
-            g_update_queue.push(FolderViewedJob(dfRec))
+            # any changes since running Fusion but turn recursion off.
+            # A job already queued for the folder is moved to the front.
+            g_update_queue.push(FolderViewedJob(dfRec), FolderJobPriority.VIEWED)
             return
         
         # Only update if not already done
@@ -517,99 +1318,221 @@ class PartsDatabase:
 
     def update_record_parts(self, rec: FolderRecord, ui_priority: bool = False):
         # Load all of this folders data files
-        self.io.load_folder_files(rec, ui_priority)
+        self.io.load_folder_files(rec)
 
-        # Add a placeholder entry for child folders if 
-        # they do not have any files or child folders yet.
-        # Otherwise they won't show up in the list in the palette.
-        for fdr in rec._childFolders:
-            child: FolderRecord = rec._childFolders[fdr]
-            try:
-                db_parts = self.database['paths'][child.path]
-            except:
-                db_parts = 0
-            if len(child._files) == 0 and len(child._childFolders) == 0 and db_parts == 0:
-                self.add_folder_placeholder(child.path)
+        # Only fetch the thumbnails of new or changed parts
+        for id in rec._files:
+            df = rec._files[id].dataFile
+            if self.icons.needs_thumbnail(id, df.versionNumber):
+                self.io.add_thumbnail_job(df, ui_priority)
 
-        # Remove the placeholder entry for this folders if
-        # we now have either child folders or files
-        if (len(rec._files) > 0 or len(rec._childFolders)) > 0:
-            self.remove_folder_placeholder(rec.path)
+    def thumbnail_saved(self, id, version):
+        self.icons.saved(id, version)
+        self.touch_part(id)
+
+    def touch_icons(self, path):
+        self.mutex.acquire()
+        ids = list(self.database['paths'].get(path, ()))
+        self.mutex.release()
+        self.icons.touch(ids)
+
+    def collect_icon_garbage(self):
+        self.mutex.acquire()
+        live_ids = set(self.database['parts'])
+        self.mutex.release()
+        self.icons.gc(live_ids)
 
     def sync_record_with_database(self, rec: FolderRecord):
+        if not rec.dataFolder:
+            # Without the folder there is nothing to compare with
+            futil.log_error(f'sync_record_with_database() -- Cannot find folder {rec.path}...')
+            return
+
+        # All the changes for this folder are written in one transaction
+        with self.store.transaction():
+            self.sync_record(rec)
+
+    def save_folder_id(self, rec: FolderRecord):
+        if rec.folder_id and self.io.update_folder_id(rec.path, rec.folder_id):
+            self.write_store(self.store.set_folder_id, rec.path, rec.folder_id)
+
+    def sync_record(self, rec: FolderRecord):
+        # Only this folder's own files and child folders are looked at
+        self.add_folder(rec.path)
+        self.save_folder_id(rec)
+
         # We need to add all the parts to the part database
         for id in rec._files:
             f: FileRecord = rec._files[id]
-            self.add_part(id, rec.path, f.dataFile.name, f.dataFile.versionNumber)
+            self.add_part(id, rec.path, f.dataFile.name, f.dataFile.versionNumber, f.dataFile.dateModified)
 
-        # Remove any child folders that have been deleted
-        child_paths = []
+        # Add the child folders so empty folders show up in the palette
+        child_paths = set()
         for fdr in rec._childFolders:
             child: FolderRecord = rec._childFolders[fdr]
-            child_paths.append( child.path )
+            child_paths.add( child.path )
+            self.add_folder( child.path )
+            self.save_folder_id( child )
 
-        delete_paths = []
-        path_length = len(rec.path.split('/'))
-        for path in self.database['paths']:
-            if path.find(rec.path) == 0 and len(path.split('/')) == path_length + 1:
-                if not path in child_paths:
-                    delete_paths.append(path)
+        # Remove any child folders that have been deleted
+        self.mutex.acquire()
+        delete_paths = self.folder_children[rec.path] - child_paths
+        delete_ids = [fid for fid in self.database['paths'][rec.path] if not fid in rec._files]
+        self.mutex.release()
 
-        # Remove the paths that are no longer there
         for path in delete_paths:
-            # Remove all the parts.  remove_part() will delete the path
-            # entry when there are no more parts
-            for fid in self.database['paths'][path]:
-                self.remove_part_at_path(fid, path)
+            futil.log(f'   Removing database folder {path}')
+            self.remove_folder(path)
                 
         # Remove any parts that have been deleted from the project
-        delete_ids = []
+        for id in delete_ids:
+            futil.log(f'   Removing database part id = {id}')
+            self.remove_part_at_path(id, rec.path)
+
+        self.folder_is_validated(rec.path)
+
+    def folder_is_validated(self, path):
+        now = time.time()
+        self.mutex.acquire()
+        self.folder_validated[path] = now
+        self.mutex.release()
+        self.write_store(self.store.set_folder_validated, path, now)
+
+    def is_folder_validated_since(self, path, since):
+        self.mutex.acquire()
+        validated = self.folder_validated.get(path, 0.0)
+        self.mutex.release()
+        return validated >= since
+
+    def is_folder_stale(self, path):
+        return not self.is_folder_validated_since(path, time.time() - config.REVALIDATE_INTERVAL)
+
+    def get_stale_folders(self):
+        # Folders that haven't been checked against the cloud for a while.
+        # Sorted so parent folders come before their children.
+        cutoff = time.time() - config.REVALIDATE_INTERVAL
+        self.mutex.acquire()
+        stale = sorted(path for path in self.database['paths']
+                       if path != '/' and self.folder_validated.get(path, 0.0) < cutoff)
+        self.mutex.release()
+        return stale
+
+    def get_meta(self):
+        return { 'built': self.database['built'],
+                 'build_date': self.database['build_date'],
+                 'project_name': self.database['project']['name'],
+                 'project_id': self.database['project']['id'] }
+
+    @traced('PartsDatabase.load')
+    def load_database_file(self):
+        db_filename = os.path.join(config.PARTS_DB_PATH, PartsDatabase.SQLITE_FILE)
         try:
-            self.mutex.acquire()
-            for fid in self.database['parts']:
-                part = self.database['parts'][fid]
-                if part['name'] != '_placeholder_' and part['path'] == rec.path and not fid in rec._files:
-                    delete_ids.append(fid)
+            self.store = PartsStore(db_filename, config.PARTS_DB_JOURNAL_LIMIT)
+        except sqlite3.Error:
+            futil.handle_error( f'Could not open parts database file {db_filename}...')
+            # Keep working from memory.  The index will be rebuilt next time.
+            self.store = PartsStore(':memory:')
+            self.icons = IconStore(self.store)
+            return False
 
-        finally:
-            self.mutex.release()
+        self.icons = IconStore(self.store)
 
-        for id in delete_ids:
-            futil.log(f'   Removing database part id = {id}')
-            del self.database['parts'][id]
+        try:
+            if self.store.is_empty():
+                # First run with the SQLite store.  Bring over the
+                # contents of the old JSON file if there is one.
+                if not self.migrate_json_file():
+                    return False
+
+            meta = self.store.get_meta()
+            parts, folders = self.store.load_parts()
+            self.io.set_folder_ids(self.store.load_folder_ids())
+            self.icons.load()
+        except sqlite3.Error:
+            futil.handle_error( f'Could not read parts database file {db_filename}...')
+            return False
 
+        self.mutex.acquire()
+        self.database = {}
+        if 'built' in meta:
+            self.database['built'] = meta['built'] == 'True'
+        if 'build_date' in meta:
+            self.database['build_date'] = meta['build_date']
+        if 'project_name' in meta:
+            self.database['project'] = {'name': meta['project_name'], 'id': meta.get('project_id', '')}
+        self.database['parts'] = parts
+
+        # Older databases used fake '_placeholder_' parts for empty folders
+        placeholders = [id for id, part in parts.items() if part.name == '_placeholder_']
+        for id in placeholders:
+            del parts[id]
+
+        self.folder_validated = folders
+        self.rebuild_folder_tree(folders)
+        self.rebuild_sorted_parts()
+        self.mutex.release()
 
-    def load_json_file(self):
-        db_filename = os.path.join(config.PARTS_DB_PATH, PartsDatabase.JSON_FILE)
-        if os.path.exists(db_filename):
-            try:
-                with open(db_filename, 'r') as f:
-                    try:
-                        self.mutex.acquire()
-                        self.database = json.load(f)
-                    except:
-                        futil.handle_error( f'Could not read parts db JSON file {db_filename}...')
-                        return False
-                    finally:
-                        self.mutex.release()
-                return True
-            except:
-                futil.handle_error( f'Could not open parts db JSON file {db_filename} for reading...')
-        else:
-            futil.log( f'Parts db JSON file {db_filename} does not exist...')
-        return False
+        if placeholders:
+            self.write_store(self.store.delete_parts, placeholders)
+        return True
+
+    @traced('PartsDatabase.save')
+    def save_database_file(self):
+        # Every part is written to the store as it changes so only
+        # the build state and icon use times need to be saved here,
+        # and only if they changed.
+        meta = self.get_meta()
+        if meta != self.saved_meta:
+            self.write_store(self.store.set_meta, meta)
+            self.saved_meta = meta
+        self.icons.flush()
+        g_metrics.set('parts_db.parts', self.get_part_count())
+        g_metrics.save()
+
+    def close(self):
+        if self.store:
+            self.store.close()
+        self.io.close()
+
+    def migrate_json_file(self):
+        # Import the old parts_db.json into the SQLite store and rename
+        # the JSON file so the migration only happens once.
+        json_filename = os.path.join(config.PARTS_DB_PATH, PartsDatabase.JSON_FILE)
+        if not os.path.exists(json_filename):
+            futil.log( f'Parts db JSON file {json_filename} does not exist...')
+            return False
 
-    def save_json_file(self):
-        db_filename = os.path.join( config.PARTS_DB_PATH, PartsDatabase.JSON_FILE )
+        futil.log( f'Migrating parts db JSON file {json_filename}...')
         try:
-            with open(db_filename, 'w') as f:
-                self.mutex.acquire()
-                json.dump(self.database, f, indent=2)
+            with open(json_filename, 'r') as f:
+                database = json.load(f)
+
+            # Thumbnails that were downloaded by the old version are
+            # assumed to be for the version of the part in the JSON file
+            icons = [(id, part['version'], part['icon']) for id, part in database['parts'].items()
+                     if os.path.exists(part['icon'])]
+
+            self.database = database
+            self.store.import_database(database)
+            self.icons.import_icons(icons)
+            self.store.set_meta(self.get_meta())
         except Exception:
-            futil.handle_error(f"Could not write parts database file '{db_filename}'.")
-        finally:
-            self.mutex.release()
+            futil.handle_error( f'Could not migrate parts db JSON file {json_filename}...')
+            return False
+
+        try:
+            os.replace(json_filename, json_filename + '.migrated')
+        except OSError:
+            futil.handle_error( f'Could not rename parts db JSON file {json_filename}...')
+
+        return True
+
 
+def parent_path( path:str ):
+    # '/A/B/' -> '/A/'
+    if path == '/':
+        return '/'
+    return path[:path.rstrip('/').rfind('/') + 1]
 
 def get_data_file( path, data_file_id ):
     global g_parts_db_io
@@ -625,20 +1548,93 @@ def load_folder( path ):
 
     g_parts_db.update_folder( path )
 
-def get_sorted_database_list():
+def get_database_folders():
+    global g_parts_db
+
+    if not g_parts_db:
+        return []
+    
+    return g_parts_db.get_folder_paths()
+
+def get_database_part( data_file_id ):
     global g_parts_db
 
     if not g_parts_db:
-        return {}
+        return None
+    
+    return g_parts_db.lookup_part( data_file_id )
+
+def get_database_snapshot():
+    # Returns the sorted parts list along with the change feed
+    # epoch and sequence number it corresponds to
+    global g_parts_db
+
+    if not g_parts_db:
+        return (), '', 0
     
     return g_parts_db.get_sorted_list()
 
+def get_database_changes( epoch, since ):
+    global g_parts_db
+
+    if not g_parts_db:
+        return None
+    
+    return g_parts_db.get_changes_since( epoch, since )
+
+def get_database_sequence():
+    global g_parts_db
+
+    if not g_parts_db:
+        return '', 0
+    
+    return g_parts_db.get_sequence()
+
+PROJECT_CACHE_FILE = 'project_cache.json'
+
+def load_project_cache():
+    # Returns {'name': project name, 'id': project id} of the project
+    # found last time or None
+    filename = os.path.join(config.PARTS_DB_PATH, PROJECT_CACHE_FILE)
+    try:
+        with open(filename, 'r') as f:
+            cache = json.load(f)
+        if 'name' in cache and 'id' in cache:
+            return cache
+    except (OSError, ValueError):
+        pass
+    return None
+
+def save_project_cache(project: adsk.core.DataProject):
+    filename = os.path.join(config.PARTS_DB_PATH, PROJECT_CACHE_FILE)
+    try:
+        temp_filename = filename + '.tmp'
+        with open(temp_filename, 'w') as f:
+            json.dump({'name': project.name, 'id': project.id}, f)
+        os.replace(temp_filename, filename)
+    except OSError:
+        futil.handle_error(f'Could not save the project cache {filename}...')
+
+@traced()
 def find_project(name: str):
+    with g_metrics.timer('cloud.find_project'):
+        return find_project_by_name(name)
+
+def find_project_by_name(name: str):
+    frc_project = None
     try:
         data = app.data
         projects = data.dataProjects
 
-        frc_project = None
+        # Go straight to the project found last time if the
+        # project name in the settings is the same
+        cache = load_project_cache()
+        if cache and cache['name'] == name:
+            proj = projects.itemById(cache['id'])
+            if proj and proj.name == name:
+                return proj
+            futil.log(f"Cached project id for '{name}' is not valid.  Searching by name...")
+
         for proj in projects:
             if proj.name == name:
                 frc_project = proj
@@ -647,6 +1643,8 @@ def find_project(name: str):
         if not frc_project:
             futil.log_error(f"Could not find project '{name}'.")
             return None
+
+        save_project_cache(frc_project)
     except:
         futil.handle_error(f"Error loading project '{name}'.")
 
@@ -657,34 +1655,58 @@ class DatabaseThread(threading.Thread):
     def __init__(self):
         threading.Thread.__init__(self)
         self.stopped = threading.Event()
+        self.start_time = time.time()
+        self.first_list_time = None     # Seconds from start_time until the palette got a parts list
 
     def stop(self):
+        global g_update_queue
+
         self.stopped.set()
+        if g_update_queue:
+            g_update_queue.wake()
 
     def run(self):
+        with g_tracer.span('DatabaseThread.run'):
+            self.run_thread()
+        g_thread_profiler.thread_exiting()
+        g_tracer.save()
+
+    def run_thread(self):
         global g_parts_db
         global g_parts_db_io
         global g_update_queue
 
+        # Closed however the thread finishes
+        io = None
+        db = None
         try:
             futil.log(f'DatabaseThread::run()...')
 
+            # Load the parts database from disk first so the last known
+            # index can be shown while the cloud project is found and
+            # checked for changes.
+            g_parts_db_io = io = PartsDatabaseFileIO()
+            g_parts_db = db = PartsDatabase(g_parts_db_io)
+            g_metrics.set('startup.load_seconds', time.time() - self.start_time)
+            if g_parts_db.is_built():
+                futil.log(f'DatabaseThread -- Loaded {g_parts_db.get_part_count()} parts from disk '
+                          f'in {time.time() - self.start_time:.3f} s...')
+                send_event_to_main_thread('set_busy', {'isBusy': False})
+                send_event_to_main_thread('update', '' )
+
             # Find the COTS database
             project = find_project(config.PARTS_DB_PROJECT)
             if not project:
-                send_event_to_main_thread('set_busy', 
-                    { 
-                        'isBusy': True, 
-                        'msg': f'Unable to Open project {config.PARTS_DB_PROJECT}!!'
-                    }
-                )
+                msg = f'Unable to Open project {config.PARTS_DB_PROJECT}!!'
+                if g_parts_db.is_built():
+                    # Keep showing the parts from the last time
+                    send_event_to_main_thread('status', {'msg': msg})
+                else:
+                    send_event_to_main_thread('set_busy', { 'isBusy': True, 'msg': msg })
+                g_event_bus.flush(True)
                 return
-            
-            # Create the parts file IO database
-            g_parts_db_io = PartsDatabaseFileIO(project)
 
-            # Load the parts database
-            g_parts_db = PartsDatabase(g_parts_db_io)
+            g_parts_db.set_project(project)
 
             if g_parts_db.is_built():
                 # Just refresh the root folder
@@ -696,14 +1718,28 @@ class DatabaseThread(threading.Thread):
             # Create the update queue and add the root folder job to it.
             g_update_queue = FolderUpdateQueue(job)
 
-            send_event_to_main_thread('set_busy', 
-                {
-                    'isBusy': True,
-                    'msg': f'LOADING DATABASE...'
-                }
-            )
+            # The unused icons are collected when the build or the
+            # revalidation finishes, not after every folder viewed later
+            collect_icons = not g_parts_db.is_built()
+            if g_parts_db.is_built():
+                # Check the folders that haven't been looked at for a
+                # while in the background.  Only the parts and folders
+                # that changed are updated.
+                stale_folders = g_parts_db.get_stale_folders()
+                futil.log(f'DatabaseThread -- Revalidating {len(stale_folders)} folders...')
+                for path in stale_folders:
+                    g_update_queue.push(FolderRevalidateJob(path))
+                collect_icons = len(stale_folders) > 0
+
+            if not g_parts_db.is_built():
+                send_event_to_main_thread('set_busy', 
+                    {
+                        'isBusy': True,
+                        'msg': f'LOADING DATABASE...'
+                    }
+                )
 
-            g_parts_db.save_json_file()
+            g_parts_db.save_database_file()
 
             busy_idx = 0
             busy_rounds = ['|', '/', '-', '\\']
@@ -725,16 +1761,23 @@ class DatabaseThread(threading.Thread):
 
             # Start the main processing loop for the database thread...
             while not self.stopped.is_set():
+                # Start or stop profiling this thread if asked to
+                g_thread_profiler.poll()
+
+                # Send the events that were held back by the rate limit
+                g_event_bus.flush()
+
                 # Check if there are thumbnail images to process
                 # Process them then 'update' the palette if priority
                 # thumbnail files were created.
                 need_update = g_parts_db_io.process_thumbnail_jobs()
+                for id, version, _icon_name in g_parts_db_io.pop_saved_thumbnails():
+                    g_parts_db.thumbnail_saved(id, version)
                 if need_update:
                     send_event_to_main_thread('update', '' )
 
                 # Now process other folders that have not been refreshed
                 if current_job and not current_job.done():
-                    time.sleep(0.02)
                     # Update the busy text to spin around.
                     if time.time() - busy_update_time > 0.5:
                         msg = busy_text + busy_rounds[busy_idx % 4]
@@ -742,8 +1785,11 @@ class DatabaseThread(threading.Thread):
                         busy_idx += 1
                         busy_update_time = time.time()
 
-                    current_job.run_step()
+                    phase_name = f'folder_job.{current_job.phase.name.lower()}'
+                    with g_tracer.span(phase_name, path=current_job.path), g_metrics.timer(phase_name):
+                        current_job.run_step()
                     if current_job.done():
+                        g_metrics.inc(f'folder_job.{type(current_job).__name__}')
                         current_job = g_update_queue.pop()
                         if first_job:
                             # Remove the busy overlay and update the parts
@@ -756,15 +1802,20 @@ class DatabaseThread(threading.Thread):
                             # We just finished the last job in the queue
                             # Save the JSON file to disk
                             g_parts_db.build_complete()
-                            g_parts_db.save_json_file()
+                            if collect_icons:
+                                g_parts_db.collect_icon_garbage()
+                                collect_icons = False
+                            g_parts_db.save_database_file()
+                            g_tracer.save()
                             send_event_to_main_thread('status', {'msg': 'Idle.'} )
                             send_event_to_main_thread('update', '' )
 
                 if not current_job:
-                    if g_update_queue.empty():                        
-                        # Nothing to do just sleep for a bit
+                    if g_update_queue.empty():
+                        # Nothing to do.  Sleep until a job is pushed, a
+                        # thumbnail needs checking or the thread is stopped.
                         busy_text = 'Updating...'
-                        time.sleep( 0.1 )
+                        g_update_queue.wait( earliest(g_parts_db_io.thumbnail_wait_time(), g_event_bus.wait_time()) )
                     else:
                         # Grab a new job
                         current_job = g_update_queue.pop()
@@ -774,8 +1825,14 @@ class DatabaseThread(threading.Thread):
                             busy_idx += 1
                             busy_update_time = time.time()
 
-            g_parts_db.save_json_file()
+            g_parts_db.save_database_file()
+            g_event_bus.flush(True)
             futil.log(f'DatabaseThread() -- Finishing normally...')
 
         except:
-            futil.handle_error( "----  DatabaseThread ERROR  ----" )
\ No newline at end of file
+            futil.handle_error( "----  DatabaseThread ERROR  ----" )
+        finally:
+            if db:
+                db.close()
+            elif io:
+                io.close()
@@ -0,0 +1,223 @@
+import os
+import time
+import hashlib
+import threading
+import sqlite3
+
+from .lib import fusionAddInUtils as futil
+from . import config
+from .parts_store import PartsStore
+
+# Thumbnail icons on disk.
+# Each icon file is named after a hash of the part's data file id so moving
+# or renaming a part never orphans or mixes up icons.  The icons table of the
+# PartsStore is the manifest of the icons that exist: the part version the
+# icon was downloaded for, its size and when it was last used.  The store
+# keeps the icons of parts that are no longer in the database from piling up
+# (gc) and keeps the total size under config.ICON_CACHE_MAX_BYTES by removing
+# the least recently used icons.
+
+def icon_folder():
+    return os.path.join(config.PARTS_DB_PATH, 'icons')
+
+def icon_basename( id:str ):
+    return hashlib.sha1(id.encode('utf-8')).hexdigest() + '.png'
+
+def get_icon_filename( id:str ):
+    """Path to the thumbnail icon of the part with data file id"""
+    return os.path.join(icon_folder(), icon_basename(id))
+
+class IconEntry:
+    def __init__(self, version, size: int, last_used: float):
+        self.version = version
+        self.size = size
+        self.last_used = last_used
+
+class IconStore:
+    def __init__(self, store: PartsStore):
+        self.store = store
+        self.folder = icon_folder()
+        self.max_bytes = config.ICON_CACHE_MAX_BYTES
+        self.mutex = threading.Lock()
+        self.manifest = {}          # id -> IconEntry
+        self.total_bytes = 0
+        self.dirty = set()          # ids with a last_used time not written yet
+
+    def load(self):
+        rows = self.store.load_icons()
+        moved = []
+        self.mutex.acquire()
+        self.manifest = {}
+        self.total_bytes = 0
+        for id, (version, filename, size, last_used) in rows.items():
+            icon_name = get_icon_filename(id)
+            if filename != icon_basename(id):
+                # Icon from an older version named after the part's path
+                if not os.path.isabs(filename):
+                    filename = os.path.join(self.folder, filename)
+                try:
+                    os.replace(filename, icon_name)
+                except OSError:
+                    continue
+                moved.append(id)
+            if not size:
+                try:
+                    size = os.path.getsize(icon_name)
+                except OSError:
+                    continue
+            self.manifest[id] = IconEntry(version, size, last_used or 0.0)
+            self.total_bytes += size
+        self.mutex.release()
+
+        if moved:
+            futil.log(f'IconStore::load() -- Renamed {len(moved)} icons to the id based names...')
+            self.write(moved)
+
+        self.enforce_budget()
+
+    def import_icons(self, icons: list):
+        # icons is a list of (id, version, filename) of existing icon
+        # files to bring into the store (e.g. from the old JSON database)
+        with self.store.transaction():
+            for id, version, filename in icons:
+                self.store.set_icon(id, version, filename, 0, 0.0)
+
+    def needs_thumbnail(self, id: str, version) -> bool:
+        entry = self.manifest.get(id)
+        if entry and entry.version == version and os.path.exists(get_icon_filename(id)):
+            return False
+        return True
+
+    def saved(self, id: str, version):
+        # A new thumbnail was written for the part
+        try:
+            size = os.path.getsize(get_icon_filename(id))
+        except OSError:
+            return
+
+        self.mutex.acquire()
+        old = self.manifest.get(id)
+        if old:
+            self.total_bytes -= old.size
+        self.manifest[id] = IconEntry(version, size, time.time())
+        self.total_bytes += size
+        self.dirty.discard(id)
+        self.mutex.release()
+
+        self.write([id])
+        self.enforce_budget()
+
+    def touch(self, ids):
+        # The icons are being shown so they are the last ones to remove
+        now = time.time()
+        self.mutex.acquire()
+        for id in ids:
+            entry = self.manifest.get(id)
+            if entry:
+                entry.last_used = now
+                self.dirty.add(id)
+        self.mutex.release()
+
+    def flush(self):
+        # Write the last used times that changed since the last flush
+        self.mutex.acquire()
+        ids = list(self.dirty)
+        self.dirty.clear()
+        self.mutex.release()
+        if ids:
+            self.write(ids)
+
+    def write(self, ids):
+        rows = []
+        self.mutex.acquire()
+        for id in ids:
+            entry = self.manifest.get(id)
+            if entry:
+                rows.append((id, entry.version, icon_basename(id), entry.size, entry.last_used))
+        self.mutex.release()
+
+        try:
+            with self.store.transaction():
+                for row in rows:
+                    self.store.set_icon(*row)
+        except sqlite3.Error:
+            futil.handle_error('IconStore::write() -- Could not write the icon manifest.')
+
+    def remove(self, ids):
+        # Must not be called with the mutex held
+        self.mutex.acquire()
+        for id in ids:
+            entry = self.manifest.pop(id, None)
+            if entry:
+                self.total_bytes -= entry.size
+            self.dirty.discard(id)
+        self.mutex.release()
+
+        for id in ids:
+            try:
+                os.remove(get_icon_filename(id))
+            except OSError:
+                pass
+
+        try:
+            self.store.delete_icons(ids)
+        except sqlite3.Error:
+            futil.handle_error('IconStore::remove() -- Could not write the icon manifest.')
+
+    def enforce_budget(self):
+        self.mutex.acquire()
+        if self.total_bytes <= self.max_bytes:
+            self.mutex.release()
+            return
+
+        by_age = sorted(self.manifest.items(), key=lambda item: item[1].last_used)
+        evict = []
+        total = self.total_bytes
+        for id, entry in by_age:
+            if total <= self.max_bytes:
+                break
+            evict.append(id)
+            total -= entry.size
+        self.mutex.release()
+
+        futil.log(f'IconStore -- Removing {len(evict)} least recently used icons...')
+        self.remove(evict)
+
+    def gc(self, live_ids):
+        # Remove the icons of parts that are not in the database any more
+        # and any files in the icon folder that don't belong to an icon.
+        self.mutex.acquire()
+        dead = [id for id in self.manifest if not id in live_ids]
+        self.mutex.release()
+        if dead:
+            self.remove(dead)
+
+        self.mutex.acquire()
+        keep = set(icon_basename(id) for id in self.manifest)
+        self.mutex.release()
+
+        orphans = 0
+        for f in os.listdir(self.folder):
+            # Thumbnails still being written are .tmp files
+            if not f in keep and not f.endswith('.tmp'):
+                try:
+                    os.remove(os.path.join(self.folder, f))
+                    orphans += 1
+                except OSError:
+                    pass
+
+        self.flush()
+        futil.log(f'IconStore::gc() -- Removed {len(dead)} unused and {orphans} orphaned icons, '
+                  f'{len(keep)} icons using {self.total_bytes / 1e6:.1f} MB...')
+
+        # The size cap may have been lowered since the last thumbnail
+        self.enforce_budget()
+
+    def forget(self):
+        # The manifest was cleared in the store.  Files left on
+        # disk are removed by the next gc().
+        self.mutex.acquire()
+        self.manifest = {}
+        self.total_bytes = 0
+        self.dirty.clear()
+        self.mutex.release()
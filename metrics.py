@@ -0,0 +1,153 @@
+import os
+import time
+import json
+import bisect
+import threading
+from contextlib import contextmanager
+
+from .lib import fusionAddInUtils as futil
+from . import config
+
+# Counters, gauges and latency histograms for the parts database.
+# They are kept in memory and are cheap enough to update on every folder
+# job step and cloud call.  snapshot() returns all of them as a dictionary
+# which is written to METRICS_FILE in config.PARTS_DB_PATH when the parts
+# database is saved and is sent to the stats view of the palette.
+#
+# Names are dotted, e.g. 'folder_job.process_files' or 'cloud.list_folder'.
+# Histograms hold times in seconds.
+
+METRICS_FILE = 'metrics.json'
+
+# Upper bounds (seconds) of the histogram buckets.  The last bucket
+# holds everything slower than the last bound.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount = 1):
+        self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+class Gauge:
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return self.value
+
+class Histogram:
+    def __init__(self, buckets = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, fraction: float):
+        # Upper bound of the bucket the percentile falls in
+        if self.count == 0:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                if i < len(self.buckets):
+                    return min(self.buckets[i], self.max)
+                return self.max
+        return self.max
+
+    def snapshot(self):
+        return { 'count': self.count,
+                 'total': self.total,
+                 'mean': self.total / self.count if self.count else None,
+                 'min': self.min,
+                 'max': self.max,
+                 'p50': self.percentile(0.5),
+                 'p90': self.percentile(0.9),
+                 'p99': self.percentile(0.99) }
+
+class MetricsRegistry:
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.start_time = time.time()
+        self.counters = {}      # name -> Counter
+        self.gauges = {}        # name -> Gauge
+        self.histograms = {}    # name -> Histogram
+
+    def get(self, table: dict, cls, name: str):
+        metric = table.get(name)
+        if metric is None:
+            self.mutex.acquire()
+            metric = table.setdefault(name, cls())
+            self.mutex.release()
+        return metric
+
+    def inc(self, name: str, amount = 1):
+        metric = self.get(self.counters, Counter, name)
+        self.mutex.acquire()
+        metric.inc(amount)
+        self.mutex.release()
+
+    def set(self, name: str, value):
+        self.get(self.gauges, Gauge, name).set(value)
+
+    def observe(self, name: str, seconds: float):
+        metric = self.get(self.histograms, Histogram, name)
+        self.mutex.acquire()
+        metric.observe(seconds)
+        self.mutex.release()
+
+    @contextmanager
+    def timer(self, name: str):
+        # Time the 'with' block into the histogram called name.  The time
+        # is recorded even if the block raises.
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        self.mutex.acquire()
+        try:
+            return { 'time': time.time(),
+                     'uptime': time.time() - self.start_time,
+                     'counters': {name: m.snapshot() for name, m in sorted(self.counters.items())},
+                     'gauges': {name: m.snapshot() for name, m in sorted(self.gauges.items())},
+                     'histograms': {name: m.snapshot() for name, m in sorted(self.histograms.items())} }
+        finally:
+            self.mutex.release()
+
+    def save(self):
+        # Write the snapshot next to the parts database.  Written to a
+        # temporary file first so a reader never sees half of it.
+        filename = os.path.join(config.PARTS_DB_PATH, METRICS_FILE)
+        try:
+            with open(filename + '.tmp', 'w') as f:
+                json.dump(self.snapshot(), f, indent=1)
+            os.replace(filename + '.tmp', filename)
+        except OSError:
+            futil.handle_error(f'MetricsRegistry::save() -- Could not write {filename}.')
+
+# The metrics of the add-in
+g_metrics = MetricsRegistry()
@@ -0,0 +1,285 @@
+import os
+import sys
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# SQLite storage engine for the PartsDatabase.
+# The PartsDatabase keeps its in-memory dictionary for serving the palette
+# and writes every change through to this store one row at a time, so there
+# is never a full re-serialization of the index.  Errors are raised as
+# sqlite3.Error and are handled (and logged) by the caller.
+#
+# The database runs in WAL mode: every committed change is appended to the
+# write-ahead log (parts_db.sqlite-wal) so a crash in the middle of a build
+# keeps everything committed so far and can never leave a half written
+# file.  Once the log grows past journal_limit bytes it is merged back
+# into the database file (a checkpoint) on a background thread.  The few
+# changes made while that ran are merged by the next commit, which then
+# starts the log over.
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY,
+    validated REAL NOT NULL DEFAULT 0,
+    folder_id TEXT
+);
+CREATE TABLE IF NOT EXISTS parts (
+    id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version,
+    modified
+);
+CREATE INDEX IF NOT EXISTS parts_by_path ON parts (path);
+CREATE TABLE IF NOT EXISTS icons (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    version,
+    size INTEGER NOT NULL DEFAULT 0,
+    last_used REAL NOT NULL DEFAULT 0
+);
+'''
+
+# Columns added after a table was first released.  They are added
+# to the tables of an older database file when it is opened.
+ADDED_COLUMNS = {
+    'folders': [('validated', 'REAL NOT NULL DEFAULT 0'),
+                ('folder_id', 'TEXT')],
+    'parts': [('modified', '')],
+    'icons': [('version', ''),
+              ('size', 'INTEGER NOT NULL DEFAULT 0'),
+              ('last_used', 'REAL NOT NULL DEFAULT 0')],
+}
+
+class PartEntry:
+    # One part of the index.  The folder path is interned so all the parts
+    # of a folder share the path string with the folder tree, and the icon
+    # filename is derived from the part's id when it is needed.
+    __slots__ = ('path', 'name', 'version', 'modified')
+
+    def __init__(self, path: str, name: str, version, modified = None):
+        self.path = sys.intern(path)
+        self.name = name
+        self.version = version
+        self.modified = modified
+
+    def __eq__(self, other):
+        return (isinstance(other, PartEntry) and self.path == other.path and self.name == other.name
+                and self.version == other.version and self.modified == other.modified)
+
+    def __repr__(self):
+        return f'PartEntry({self.path!r}, {self.name!r}, {self.version!r}, {self.modified!r})'
+
+class PartsStore:
+    def __init__(self, filename: str, journal_limit: int = 4 * 1024 * 1024):
+        self.filename = filename
+        self.lock = threading.RLock()
+        self._depth = 0
+        # Autocommit mode.  Transactions are started explicitly
+        # with transaction() so several rows can be grouped.
+        self.conn = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+
+        self.journal_limit = journal_limit
+        self.wal_filename = filename + '-wal'
+        self.checkpoint_thread = None
+        self.checkpoint_done = False
+        self.checkpoints = 0
+        if filename != ':memory:':
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            # A commit only has to reach the log, not the database file
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            # Checkpoints are run by checkpoint() instead of on commit
+            self.conn.execute('PRAGMA wal_autocheckpoint=0')
+            self.conn.execute(f'PRAGMA journal_size_limit={int(journal_limit)}')
+
+        self.conn.executescript(SCHEMA)
+        self.add_missing_columns()
+
+    def add_missing_columns(self):
+        for table, columns in ADDED_COLUMNS.items():
+            existing = [row[1] for row in self.conn.execute(f'PRAGMA table_info({table})')]
+            for name, decl in columns:
+                if not name in existing:
+                    self.conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {decl}')
+
+    def close(self):
+        # Closing the last connection checkpoints the whole log
+        thread = self.checkpoint_thread
+        if thread:
+            thread.join()
+        with self.lock:
+            self.conn.close()
+
+    def journal_size(self) -> int:
+        try:
+            return os.path.getsize(self.wal_filename)
+        except OSError:
+            return 0
+
+    def check_journal(self):
+        # Called with the lock held after each commit
+        if self.filename == ':memory:':
+            return
+
+        if self.checkpoint_done:
+            # Merge what was written during the background checkpoint
+            # and start the log over
+            self.checkpoint_done = False
+            self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            return
+
+        if self.journal_size() < self.journal_limit:
+            return
+        thread = self.checkpoint_thread
+        if thread and thread.is_alive():
+            return
+
+        # Start a background checkpoint since the log has grown too big
+        self.checkpoint_thread = threading.Thread(target=self.checkpoint, daemon=True)
+        self.checkpoint_thread.start()
+
+    def checkpoint(self):
+        # Copy the log into the database file on a connection of its own
+        # so the writers don't wait for it
+        try:
+            conn = sqlite3.connect(self.filename, isolation_level=None)
+            try:
+                conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+            finally:
+                conn.close()
+            self.checkpoints += 1
+            self.checkpoint_done = True
+        except sqlite3.Error:
+            # Tried again after the next commit
+            pass
+
+    @contextmanager
+    def transaction(self):
+        # Group all the writes made inside the 'with' block into one
+        # transaction.  Nested calls join the outer transaction.
+        with self.lock:
+            outer = self._depth == 0
+            if outer:
+                self.conn.execute('BEGIN')
+            self._depth += 1
+            try:
+                yield self.conn
+            except:
+                self._depth -= 1
+                if outer:
+                    self.conn.execute('ROLLBACK')
+                raise
+            self._depth -= 1
+            if outer:
+                self.conn.execute('COMMIT')
+                self.check_journal()
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            row = self.conn.execute('SELECT COUNT(*) FROM meta').fetchone()
+        return row[0] == 0
+
+    def clear(self):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM meta')
+            conn.execute('DELETE FROM folders')
+            conn.execute('DELETE FROM parts')
+            conn.execute('DELETE FROM icons')
+
+    def get_meta(self) -> dict:
+        with self.lock:
+            rows = self.conn.execute('SELECT key, value FROM meta').fetchall()
+        return dict(rows)
+
+    def set_meta(self, values: dict):
+        with self.transaction() as conn:
+            conn.executemany('INSERT INTO meta (key, value) VALUES (?, ?) '
+                             'ON CONFLICT (key) DO UPDATE SET value = excluded.value',
+                             [(k, str(v)) for k, v in values.items()])
+
+    def upsert_part(self, id: str, path: str, name: str, version, modified):
+        with self.transaction() as conn:
+            conn.execute('INSERT OR IGNORE INTO folders (path) VALUES (?)', (path,))
+            conn.execute('INSERT INTO parts (id, path, name, version, modified) VALUES (?, ?, ?, ?, ?) '
+                         'ON CONFLICT (id) DO UPDATE SET path = excluded.path, '
+                         'name = excluded.name, version = excluded.version, modified = excluded.modified',
+                         (id, path, name, version, modified))
+
+    def set_icon(self, id: str, version, filename: str, size: int, last_used: float):
+        # Record the version of the part a thumbnail was downloaded for
+        with self.transaction() as conn:
+            conn.execute('INSERT INTO icons (id, filename, version, size, last_used) VALUES (?, ?, ?, ?, ?) '
+                         'ON CONFLICT (id) DO UPDATE SET filename = excluded.filename, '
+                         'version = excluded.version, size = excluded.size, last_used = excluded.last_used',
+                         (id, filename, version, size, last_used))
+
+    def delete_icons(self, ids: list):
+        with self.transaction() as conn:
+            conn.executemany('DELETE FROM icons WHERE id = ?', [(id,) for id in ids])
+
+    def load_icons(self):
+        # Returns the icon manifest as id -> (version, filename, size, last_used)
+        with self.lock:
+            rows = self.conn.execute('SELECT id, version, filename, size, last_used FROM icons').fetchall()
+        return {id: (version, filename, size, last_used) for id, version, filename, size, last_used in rows}
+
+    def delete_parts(self, ids: list):
+        with self.transaction() as conn:
+            conn.executemany('DELETE FROM parts WHERE id = ?', [(id,) for id in ids])
+
+    def add_folder(self, path: str):
+        with self.transaction() as conn:
+            conn.execute('INSERT OR IGNORE INTO folders (path) VALUES (?)', (path,))
+
+    def set_folder_validated(self, path: str, validated: float):
+        # Record when the folder was last checked against the cloud
+        with self.transaction() as conn:
+            conn.execute('INSERT INTO folders (path, validated) VALUES (?, ?) '
+                         'ON CONFLICT (path) DO UPDATE SET validated = excluded.validated',
+                         (path, validated))
+
+    def set_folder_id(self, path: str, folder_id: str):
+        with self.transaction() as conn:
+            conn.execute('INSERT INTO folders (path, folder_id) VALUES (?, ?) '
+                         'ON CONFLICT (path) DO UPDATE SET folder_id = excluded.folder_id',
+                         (path, folder_id))
+
+    def load_folder_ids(self) -> dict:
+        # Returns folder path -> the id of the folder's DataFolder
+        with self.lock:
+            rows = self.conn.execute('SELECT path, folder_id FROM folders WHERE folder_id IS NOT NULL').fetchall()
+        return {sys.intern(path): folder_id for path, folder_id in rows}
+
+    def delete_folders(self, paths: list):
+        with self.transaction() as conn:
+            conn.executemany('DELETE FROM folders WHERE path = ?', [(path,) for path in paths])
+
+    def load_parts(self):
+        # Returns the parts dictionary in the same layout as
+        # PartsDatabase.database['parts'] and the folder paths
+        # with the time each one was last validated
+        with self.lock:
+            rows = self.conn.execute('SELECT id, path, name, version, modified FROM parts').fetchall()
+            folders = dict(self.conn.execute('SELECT path, validated FROM folders'))
+
+        parts = {id: PartEntry(path, name, version, modified)
+                 for id, path, name, version, modified in rows}
+        folders = {sys.intern(path): validated for path, validated in folders.items()}
+
+        return parts, folders
+
+    def import_database(self, database: dict):
+        # Bulk load a database dictionary (e.g. from the old JSON file)
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM folders')
+            conn.execute('DELETE FROM parts')
+            conn.executemany('INSERT OR IGNORE INTO folders (path) VALUES (?)',
+                             [(path,) for path in database['paths']])
+            conn.executemany('INSERT OR REPLACE INTO parts (id, path, name, version, modified) VALUES (?, ?, ?, ?, ?)',
+                             [(id, p['path'], p['name'], p['version'], p.get('modified'))
+                              for id, p in database['parts'].items()])
@@ -0,0 +1,286 @@
+import adsk.core
+import os
+import time
+import heapq
+import threading
+from collections import deque
+
+from .lib import fusionAddInUtils as futil
+from . import config
+from .metrics import g_metrics
+
+# Fetches part thumbnails from the cloud.
+# Only a limited number of DataObjectFutures are in flight at once.  Every
+# call to process() starts new futures up to that limit and polls all of the
+# in-flight ones in a single sweep.  A future that does not finish before
+# its deadline (or fails) is retried with an exponential backoff and after
+# the last retry the file goes into a negative cache so it is not requested
+# again for a while.
+
+class ThumbnailJob:
+    def __init__(self, id: str, version, icon_name: str, dataFile: adsk.core.DataFile, priority: bool):
+        self.id = id
+        self.version = version
+        self.icon_name = icon_name
+        self.dataFile = dataFile
+        self.priority = priority
+        self.future: adsk.core.DataObjectFuture = None
+        self.started = 0.0
+        self.deadline = 0.0
+        self.attempts = 0
+        self.done = False
+
+class ThumbnailScheduler:
+    def __init__(self):
+        self.max_in_flight = max(1, config.THUMBNAIL_MAX_IN_FLIGHT)
+        self.job_timeout = config.THUMBNAIL_JOB_TIMEOUT
+        self.max_retries = config.THUMBNAIL_MAX_RETRIES
+        self.retry_delay = config.THUMBNAIL_RETRY_DELAY
+        self.failure_cache_time = config.THUMBNAIL_FAILURE_CACHE_TIME
+        self.poll_interval = config.THUMBNAIL_POLL_INTERVAL
+
+        self.mutex = threading.Lock()
+        self.pending = deque()              # ThumbnailJob
+        self.priority_pending = deque()     # ThumbnailJob requested by the UI
+        self.retries = []                   # heap of (retry time, count, ThumbnailJob)
+        self.in_flight = []                 # ThumbnailJob with a future
+        self.jobs = {}                      # id -> ThumbnailJob not done yet
+        self.failed = {}                    # id -> (time, version) of a failed thumbnail
+        self.saved = deque()                # (id, version, icon name) of new thumbnails
+        self.retry_count = 0
+        self.recorder = None                # CloudTraceRecorder of the thumbnail results
+
+        # Counters
+        self.submitted = 0
+        self.saved_count = 0
+        self.failed_count = 0
+        self.timed_out_count = 0
+        self.retried_count = 0
+        self.busy_start = None
+        self.busy_saved = 0
+
+    def add_job(self, id: str, version, icon_name: str, dataFile: adsk.core.DataFile, ui_priority: bool):
+        self.mutex.acquire()
+        try:
+            failure = self.failed.get(id)
+            if failure:
+                failed_time, failed_version = failure
+                if failed_version == version and time.time() - failed_time < self.failure_cache_time:
+                    # This thumbnail failed recently.  Don't ask again yet.
+                    return
+                del self.failed[id]
+
+            job = self.jobs.get(id)
+            if job:
+                # Already waiting.  Move it to the front if the UI wants it.
+                if ui_priority and not job.priority and not job.future:
+                    job.priority = True
+                    self.priority_pending.append(job)
+                return
+
+            job = ThumbnailJob(id, version, icon_name, dataFile, ui_priority)
+            self.jobs[id] = job
+            self.submitted += 1
+            g_metrics.inc('thumbnails.submitted')
+            if ui_priority:
+                self.priority_pending.append(job)
+            else:
+                self.pending.append(job)
+        finally:
+            self.mutex.release()
+
+    def has_work(self) -> bool:
+        return len(self.jobs) > 0
+
+    def queue_depth(self) -> int:
+        return len(self.priority_pending) + len(self.pending) + len(self.retries)
+
+    def wait_time(self):
+        # Seconds until process() has something to do or None if there
+        # are no thumbnails waiting.  The futures can't signal when they
+        # finish so they are polled while any are in flight.
+        if not self.has_work():
+            return None
+        if self.in_flight:
+            return self.poll_interval
+        self.mutex.acquire()
+        try:
+            if self.priority_pending or self.pending:
+                return 0.0
+            if self.retries:
+                return max(0.0, self.retries[0][0] - time.time())
+            return None
+        finally:
+            self.mutex.release()
+
+    def next_job(self, now: float):
+        # Must be called with the mutex held
+        while self.retries and self.retries[0][0] <= now:
+            job = heapq.heappop(self.retries)[2]
+            # The UI may have asked for it again while it was waiting
+            if not job.done and not job.future:
+                return job
+
+        while self.priority_pending:
+            job = self.priority_pending.popleft()
+            if not job.done and not job.future:
+                return job
+
+        while self.pending:
+            job = self.pending.popleft()
+            # Jobs moved to the priority queue were already started
+            if not job.done and not job.future and not job.priority:
+                return job
+
+        return None
+
+    def start_jobs(self, now: float):
+        while len(self.in_flight) < self.max_in_flight:
+            self.mutex.acquire()
+            job = self.next_job(now)
+            self.mutex.release()
+            if not job:
+                return
+
+            try:
+                job.future = job.dataFile.thumbnail
+            except:
+                futil.handle_error(f'   Error requesting thumbnail {job.icon_name}...')
+                job.future = None
+
+            job.attempts += 1
+            job.started = now
+            job.deadline = now + self.job_timeout
+            if job.future:
+                self.in_flight.append(job)
+            else:
+                self.retry_or_fail(job, now)
+
+    def process(self) -> bool:
+        # Start new thumbnail requests and poll all of the ones in flight.
+        # Returns True if a thumbnail the UI asked for was saved.
+        if not self.has_work():
+            return False
+
+        now = time.time()
+        if self.busy_start is None:
+            self.busy_start = now
+            self.busy_saved = self.saved_count
+
+        self.start_jobs(now)
+
+        need_update = False
+        still_in_flight = []
+        for job in self.in_flight:
+            state = job.future.state
+            if state == adsk.core.FutureStates.FinishedFutureState:
+                if self.save_thumbnail(job):
+                    need_update = need_update or job.priority
+                else:
+                    self.retry_or_fail(job, now)
+            elif state == adsk.core.FutureStates.ProcessingFutureState:
+                if now < job.deadline:
+                    still_in_flight.append(job)
+                else:
+                    self.timed_out_count += 1
+                    g_metrics.inc('thumbnails.timed_out')
+                    futil.log(f'   Thumbnail for {job.icon_name} timed out...')
+                    self.retry_or_fail(job, now)
+            else:
+                self.retry_or_fail(job, now)
+        self.in_flight = still_in_flight
+
+        # Fill the slots that just opened up
+        self.start_jobs(now)
+        g_metrics.set('thumbnails.in_flight', len(self.in_flight))
+        g_metrics.set('thumbnails.queued', self.queue_depth())
+
+        if not self.has_work():
+            # Only report the longer bursts of downloads
+            if time.time() - self.busy_start > 1.0:
+                self.log_stats()
+            self.busy_start = None
+
+        return need_update
+
+    def save_thumbnail(self, job: ThumbnailJob) -> bool:
+        try:
+            if job.future.dataObject == None:
+                return False
+
+            # Write to a temporary file and then rename it so a
+            # partly written icon is never seen by the palette
+            temp_name = job.icon_name + '.tmp'
+            job.future.dataObject.saveToFile( temp_name )
+            os.replace( temp_name, job.icon_name )
+        except:
+            futil.handle_error(f'   Error processing thumbnail {job.icon_name}...')
+            return False
+
+        if self.recorder:
+            self.recorder.thumbnail(job.id, time.time() - job.started, True)
+        self.finish_job(job)
+        self.saved.append((job.id, job.version, job.icon_name))
+        self.saved_count += 1
+        g_metrics.inc('thumbnails.saved')
+        g_metrics.observe('thumbnails.download', time.time() - job.started)
+        return True
+
+    def retry_or_fail(self, job: ThumbnailJob, now: float):
+        job.future = None
+        if self.recorder:
+            self.recorder.thumbnail(job.id, now - job.started, False)
+        if job.attempts <= self.max_retries:
+            # Exponential backoff: retry_delay, 2 * retry_delay, 4 * retry_delay...
+            retry_time = now + self.retry_delay * (2 ** (job.attempts - 1))
+            self.mutex.acquire()
+            self.retry_count += 1
+            heapq.heappush(self.retries, (retry_time, self.retry_count, job))
+            self.mutex.release()
+            self.retried_count += 1
+            g_metrics.inc('thumbnails.retried')
+            return
+
+        futil.log(f'   Retrieving thumbnail for {job.icon_name} failed...')
+        self.mutex.acquire()
+        self.failed[job.id] = (now, job.version)
+        self.mutex.release()
+        self.finish_job(job)
+        self.failed_count += 1
+        g_metrics.inc('thumbnails.failed')
+
+    def finish_job(self, job: ThumbnailJob):
+        self.mutex.acquire()
+        job.done = True
+        if self.jobs.get(job.id) is job:
+            del self.jobs[job.id]
+        self.mutex.release()
+
+    def pop_saved(self):
+        # Return (id, version, icon name) of the thumbnails saved since the last call
+        ids = []
+        while self.saved:
+            ids.append(self.saved.popleft())
+        return ids
+
+    def get_stats(self) -> dict:
+        stats = { 'submitted': self.submitted,
+                  'saved': self.saved_count,
+                  'failed': self.failed_count,
+                  'timed_out': self.timed_out_count,
+                  'retried': self.retried_count,
+                  'in_flight': len(self.in_flight),
+                  'queued': self.queue_depth(),
+                  'negative_cache': len(self.failed),
+                  'per_second': 0.0 }
+        if self.busy_start is not None:
+            elapsed = time.time() - self.busy_start
+            if elapsed > 0:
+                stats['per_second'] = (self.saved_count - self.busy_saved) / elapsed
+        return stats
+
+    def log_stats(self):
+        stats = self.get_stats()
+        futil.log(f'Thumbnails: saved {stats["saved"]} of {stats["submitted"]} '
+                  f'({stats["per_second"]:.1f}/s), failed {stats["failed"]}, '
+                  f'timed out {stats["timed_out"]}, retried {stats["retried"]}')
@@ -0,0 +1,128 @@
+import os
+import time
+import json
+import functools
+import threading
+from collections import deque
+
+from .lib import fusionAddInUtils as futil
+from . import config
+
+# Span tracer for finding where the wall time goes.
+# A span is a named, timed block of code on one thread:
+#
+#     with g_tracer.span('PartsDatabase.load'):
+#         ...
+#
+# or a whole function decorated with @traced().  The spans are written to
+# TRACE_FILE in config.PARTS_DB_PATH in the Chrome trace event format which
+# opens in chrome://tracing, Perfetto or speedscope.
+#
+# Tracing is switched on with config.TRACE_ENABLED.  When it is off span()
+# returns a shared do-nothing context manager and @traced() functions make
+# one attribute check before calling straight through.
+
+TRACE_FILE = 'trace.json'
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Span:
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer: 'Tracer', name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add_span(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+class Tracer:
+    def __init__(self):
+        self.enabled = config.TRACE_ENABLED
+        self.origin = time.perf_counter_ns()
+        self.events = deque(maxlen=config.TRACE_MAX_EVENTS)
+        self.thread_names = {}      # thread id -> name
+
+    def span(self, name: str, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def micros(self, ns: int) -> float:
+        return (ns - self.origin) / 1000.0
+
+    def add_span(self, name: str, start: int, end: int, args: dict):
+        tid = threading.get_ident()
+        if not tid in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        event = {'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': tid,
+                 'ts': self.micros(start), 'dur': (end - start) / 1000.0}
+        if args:
+            event['args'] = args
+        # deque.append is atomic so spans from any thread can be added
+        self.events.append(event)
+
+    def instant(self, name: str, **args):
+        # A point in time such as the first parts list reaching the palette
+        if not self.enabled:
+            return
+        tid = threading.get_ident()
+        if not tid in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        event = {'name': name, 'ph': 'i', 's': 'p', 'pid': os.getpid(), 'tid': tid,
+                 'ts': self.micros(time.perf_counter_ns())}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def save(self):
+        # Write the spans recorded so far.  The file is replaced as a
+        # whole so a viewer never opens half of it.
+        if not self.enabled or not self.events:
+            return
+
+        pid = os.getpid()
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                  for tid, name in list(self.thread_names.items())]
+        events.extend(list(self.events))
+
+        filename = os.path.join(config.PARTS_DB_PATH, TRACE_FILE)
+        try:
+            with open(filename + '.tmp', 'w') as f:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+            os.replace(filename + '.tmp', filename)
+            futil.log(f'Tracer::save() -- Wrote {len(events)} trace events to {filename}...')
+        except OSError:
+            futil.handle_error(f'Tracer::save() -- Could not write {filename}.')
+
+# The tracer of the add-in
+g_tracer = Tracer()
+
+def traced(name: str = None):
+    """Decorator that records every call of the function as a span.
+    The span is named after the function unless a name is given."""
+    def decorate(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not g_tracer.enabled:
+                return fn(*args, **kwargs)
+            with Span(g_tracer, span_name, None):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate